@@ -1,11 +1,68 @@
+import copy
+import logging
+import os
+import random
+import struct
 import sys
+import zlib
+from array import array
+
 import numpy as np
-import random
+
+# Silent unless whatever uses the machine sets up logging, as main.py and
+# headless.py do
+logger = logging.getLogger('chip8')
+logger.addHandler(logging.NullHandler())
+
+# Marsaglia's 32 bit xorshift, for CXNN. It is far cheaper than random.Random,
+# and all of its state is one number, which fits in a saved state.
+class XorShift:
+    def __init__(self, seed=0):
+        # Spread small seeds out, so that the first numbers aren't tiny
+        self.state = (seed * 0x9E3779B9 + 1) & 0xFFFFFFFF or 1
+
+    def getrandbits(self, bits):
+        x = self.state
+        x ^= (x << 13) & 0xFFFFFFFF
+        x ^= x >> 17
+        x ^= (x << 5) & 0xFFFFFFFF
+        self.state = x
+        return x >> (32 - bits)
+
+# A random 64 bit key for every pixel of the screen, for Zobrist hashing. The
+# keys come from a fixed seed, so the same screen hashes the same everywhere,
+# and digests can be stored and compared between runs.
+def pixel_keys(width, height, seed=0x5EED):
+    generator = XorShift(seed)
+    keys = [generator.getrandbits(32) << 32 | generator.getrandbits(32) for pixel in range(0, width * height)]
+    return np.array(keys, dtype=np.uint64).reshape(height, width)
+
+# The same keys four pixels at a time, as [y][x][bits], the XOR of the keys
+# of the pixels set in bits from x rightwards, so that a sprite's row can be
+# hashed with two lookups. Pixels past the right of the screen have no key.
+def nibble_keys(keys):
+    height, width = keys.shape
+    padded = np.zeros((height, width + 8), dtype=np.uint64)
+    padded[:, 0:width] = keys
+    nibbles = np.zeros((height, width + 4, 16), dtype=np.uint64)
+    for bits in range(0, 16):
+        for pixel in range(0, 4):
+            if bits & (8 >> pixel):
+                nibbles[:, :, bits] ^= padded[:, pixel:pixel + width + 4]
+    return nibbles.tolist()
 
 class Chip8:
     screen_width = 64
     screen_height = 32
-    ops_per_second = 60
+    # Programs are loaded at 0x200, and can fill the rest of memory
+    max_game_size = 4096 - 0x200
+    # The timers count down at 60Hz. A frame is one tick of the timers, and
+    # the instructions run in between.
+    timer_hz = 60
+    cycles_per_frame = 10
+    # See screen_digest
+    pixel_keys = pixel_keys(screen_width, screen_height)
+    nibble_keys = nibble_keys(pixel_keys)
 
     font_set = [
         0xf0, 0x90, 0x90, 0x90, 0xf0,  # 0
@@ -26,17 +83,51 @@ class Chip8:
         0xf0, 0x80, 0xf0, 0x80, 0x80,  # F
     ]
 
+    # Saved states are this header, followed by the stack, V, keys, memory and
+    # graphics as they are laid out in the machine. The header holds a magic
+    # number, the version of the layout, then PC, I, SP, the delay and sound
+    # timers, the draw flag and the state of the random number generator.
+    state_magic = b'CH8S'
+    state_version = 2
+    state_header = struct.Struct('<4sBHHBBB?I')
+    state_size = state_header.size + 32 + 16 + 16 + 4096 + 64 * 32
+
+    # Each machine has its own random number generator for CXNN, seeded from
+    # the seed given here, or a random one. It is put back to the start of
+    # its sequence on every reset, so a run can be repeated exactly.
+    def __init__(self, seed=None):
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.seed = seed
+
+        # The machine state lives in flat buffers that are allocated once and
+        # cleared in place by reset(), so views taken of them stay valid.
+        self.memory = bytearray(4096)
+        self.v = bytearray(16)
+        self.key = bytearray(16)
+        self.stack = array('H', bytes(32))
+        self.graphics = bytearray(self.screen_width * self.screen_height)
+        # The same pixels as graphics, as rows and columns for drawing into
+        self.screen = np.frombuffer(self.graphics, dtype=np.uint8).reshape(self.screen_height, self.screen_width)
+        # See changed_rows()
+        self.generation = 0
+        self.row_generations = np.zeros(self.screen_height, dtype=np.int64)
+        # The XOR of the keys of every pixel that is set, kept up to date as
+        # pixels are flipped, so the screen can be compared without reading
+        # it. Anything that writes to graphics directly has to set it again
+        # from compute_screen_digest().
+        self.screen_digest = 0
+        # See attach()
+        self.observers = []
+        # See emit()
+        self.listeners = {}
+        self.event_counts = {}
+
     def initialise(self):
         self.reset()
         self.setup_opcode_pointers()
 
     def setup_opcode_pointers(self):
-        self.chip8_table = [
-            self.cpu0xxx, self.cpu1xxx, self.cpu2xxx, self.cpu3xxx,
-            self.cpu4xxx, self.cpu5xxx, self.cpu6xxx, self.cpu7xxx,
-            self.cpu8xxx, self.cpu9xxx, self.cpuAxxx, self.cpuBxxx,
-            self.cpuCxxx, self.cpuDxxx, self.cpuExxx, self.cpuFxxx,
-        ]
         self.chip8_system = [
             self.cpu00E0, self.cpuNULL, self.cpuNULL, self.cpuNULL,
             self.cpuNULL, self.cpuNULL, self.cpuNULL, self.cpuNULL,
@@ -55,12 +146,6 @@ class Chip8:
             self.cpuNULL, self.cpuEx9x, self.cpuExAx, self.cpuNULL,
             self.cpuNULL, self.cpuNULL, self.cpuNULL, self.cpuNULL,
         ]
-        self.chip8_misc = [
-            self.cpuFxx, self.cpuFx1x, self.cpuFx2x, self.cpuFx3x,
-            self.cpuNULL, self.cpuFx5x, self.cpuFx6x, self.cpuNULL,
-            self.cpuNULL, self.cpuNULL, self.cpuNULL, self.cpuNULL,
-            self.cpuNULL, self.cpuNULL, self.cpuNULL, self.cpuNULL,
-        ]
         self.chip8_fxn = [
             self.cpuNULL, self.cpuNULL, self.cpuNULL, self.cpuNULL,
             self.cpuNULL, self.cpuNULL, self.cpuNULL, self.cpuFx7,
@@ -73,8 +158,22 @@ class Chip8:
             self.cpuFx18, self.cpuNULL, self.cpuNULL, self.cpuNULL,
             self.cpuNULL, self.cpuNULL, self.cpuFx1E, self.cpuNULL,
         ]
+        self.chip8_misc = [
+            self.chip8_fxn, self.chip8_fx1n, self.cpuFx2x, self.cpuFx3x,
+            self.cpuNULL, self.cpuFx5x, self.cpuFx6x, self.cpuNULL,
+            self.cpuNULL, self.cpuNULL, self.cpuNULL, self.cpuNULL,
+            self.cpuNULL, self.cpuNULL, self.cpuNULL, self.cpuNULL,
+        ]
+        # Families 0, 8, E and F hold another table, and are picked apart
+        # further in decode()
+        self.chip8_table = [
+            self.chip8_system, self.cpu1xxx, self.cpu2xxx, self.cpu3xxx,
+            self.cpu4xxx, self.cpu5xxx, self.cpu6xxx, self.cpu7xxx,
+            self.chip8_arithmetic, self.cpu9xxx, self.cpuAxxx, self.cpuBxxx,
+            self.cpuCxxx, self.cpuDxxx, self.chip8_skip, self.chip8_misc,
+        ]
 
-    def reset(self):
+    def reset(self, seed=None):
         self.program_counter = 0x200 # Program starts at 0x200
         self.opcode = 0
         self.i = 0
@@ -82,169 +181,543 @@ class Chip8:
 
         self.clear_screen()
 
-        self.stack = [0] * 16
-        self.v = [0] * 16
-        self.key = [0] * 16
+        self.stack[:] = array('H', bytes(32))
+        self.v[:] = bytes(16)
+        self.key[:] = bytes(16)
 
-        self.memory = [0] * 4096
+        self.memory[:] = bytes(4096)
+        self.memory[0:len(self.font_set)] = bytes(self.font_set)
 
-        for (counter, font) in enumerate(self.font_set):
-            self.memory[counter] = font
+        self.clear_caches()
 
         self.delay_timer = 0
         self.sound_timer = 0
+        # Set to 'key' or 'timer' when the program is spinning, waiting for a
+        # key press or for the delay timer to run out
+        self.waiting = None
+        # Frames run since the reset, including any skipped by fast_forward
+        self.frame_count = 0
+        # Events are counted, and only the first few logged, for each run
+        self.event_counts = {}
 
-        self.test_rand = False
+        if seed is not None:
+            self.seed = seed
+        self.seed_random(self.seed)
+
+    # Start the random number generator from a seed. Anything else with a
+    # getrandbits() method can be put in self.random instead, but only an
+    # XorShift can be saved in a state.
+    def seed_random(self, seed):
+        self.seed = seed
+        self.random = XorShift(seed)
 
     def clear_screen(self):
-        self.graphics = [0] * (self.screen_width * self.screen_height)
+        self.graphics[:] = bytes(len(self.graphics))
         self.draw_flag = True
+        self.generation += 1
+        self.row_generations[:] = self.generation
+        self.screen_digest = 0
+
+    # The digest of the screen worked out from scratch, which screen_digest
+    # should always be the same as
+    def compute_screen_digest(self):
+        return int(np.bitwise_xor.reduce(self.pixel_keys[self.screen != 0]))
+
+    # The generation goes up by one every time the screen changes, and each
+    # row of the screen keeps the generation it last changed in. Anything
+    # presenting the screen can keep the generation it last presented, and
+    # only redraw or send the rows that have changed since then.
+    def changed_rows(self, since):
+        return np.flatnonzero(self.row_generations > since)
 
+    # Read only views of the machine state, for snapshots, renderers and tests
+    # to look at without copying
+    def views(self):
+        return {
+            'memory': memoryview(self.memory).toreadonly(),
+            'v': memoryview(self.v).toreadonly(),
+            'stack': memoryview(self.stack).toreadonly(),
+            'key': memoryview(self.key).toreadonly(),
+            'graphics': memoryview(self.graphics).toreadonly(),
+        }
+
+    # Save the whole machine as one fixed size blob of bytes, optionally
+    # compressed with zlib
+    def save_state(self, compress=False):
+        header = self.state_header.pack(
+            self.state_magic,
+            self.state_version,
+            self.program_counter,
+            self.i,
+            self.stack_pointer,
+            self.delay_timer,
+            self.sound_timer,
+            self.draw_flag,
+            self.random.state,
+        )
+        stack = self.stack
+        if sys.byteorder != 'little':
+            stack = array('H', stack)
+            stack.byteswap()
+        state = b''.join((header, stack, self.v, self.key, self.memory, self.graphics))
+        if compress:
+            return zlib.compress(state, 1)
+        return state
+
+    # Restore the machine from a blob made by save_state, compressed or not
+    def load_state(self, state):
+        if state[0:len(self.state_magic)] != self.state_magic:
+            state = zlib.decompress(state)
+        version = state[len(self.state_magic)]
+        if version != self.state_version:
+            raise ValueError("Saved state is version %d, expected %d" % (version, self.state_version))
+        if len(state) != self.state_size:
+            raise ValueError("Saved state is %d bytes, expected %d" % (len(state), self.state_size))
+        (magic, version, self.program_counter, self.i, self.stack_pointer,
+         self.delay_timer, self.sound_timer, self.draw_flag,
+         self.random.state) = self.state_header.unpack_from(state)
+
+        state = memoryview(state)
+        offset = self.state_header.size
+        for buffer in (memoryview(self.stack).cast('B'), self.v, self.key, self.memory, self.graphics):
+            buffer[:] = state[offset:offset + len(buffer)]
+            offset += len(buffer)
+        if sys.byteorder != 'little':
+            self.stack.byteswap()
+        self.waiting = None
+        self.clear_caches()
+        self.generation += 1
+        self.row_generations[:] = self.generation
+        self.screen_digest = self.compute_screen_digest()
+
+    # A copy of the machine that can run on separately. Compiled blocks don't
+    # hold on to the machine, so the copy starts with them already compiled.
+    def clone(self):
+        other = Chip8(self.seed)
+        other.setup_opcode_pointers()
+        for name in ('memory', 'v', 'key', 'stack', 'graphics'):
+            getattr(other, name)[:] = getattr(self, name)
+        for name in ('program_counter', 'opcode', 'i', 'stack_pointer', 'delay_timer',
+                     'sound_timer', 'draw_flag', 'waiting', 'frame_count', 'cycles_per_frame'):
+            setattr(other, name, getattr(self, name))
+        other.random = copy.copy(self.random)
+        other.generation = self.generation
+        other.row_generations[:] = self.row_generations
+        other.screen_digest = self.screen_digest
+        other.clear_caches()
+        other.block_cache = dict(self.block_cache)
+        other.block_owners = {address: list(owners) for (address, owners) in self.block_owners.items()}
+        return other
+
+    # Load a game from a file path, or from bytes or any other buffer already
+    # in memory, straight into memory at 0x200. Returns the size of the game.
     def load_game(self, game):
-        print("Loading game %s" % game)
-        with open(game, 'rb') as game_file:
-            counter = 0
-            while True:
-                byte = game_file.read(1)
-                if byte == b'':
-                    break
-                self.memory[0x200 + counter] = np.fromstring(bytes(byte), dtype=np.uint8, count=1)
-                counter += 1
+        if isinstance(game, (str, os.PathLike)):
+            with open(game, 'rb') as game_file:
+                size = os.fstat(game_file.fileno()).st_size
+                self.check_game_size(size)
+                size = game_file.readinto(memoryview(self.memory)[0x200:0x200 + size])
+            self.emit('load', game, size)
+        else:
+            game = memoryview(game).cast('B')
+            size = len(game)
+            self.check_game_size(size)
+            self.memory[0x200:0x200 + size] = game
+            self.emit('load', '<memory>', size)
+        self.clear_caches()
+        return size
+
+    def check_game_size(self, size):
+        if size > self.max_game_size:
+            raise ValueError("Game is %d bytes, but only %d will fit in memory" % (size, self.max_game_size))
+
+    # Forget everything decoded or compiled from memory
+    def clear_caches(self):
+        # Decoded instructions, indexed by address. See execute_opcode.
+        self.decode_cache = [None] * 4096
+        # Compiled blocks, by start address, and the blocks each address
+        # is part of. See run_block.
+        self.block_cache = {}
+        self.block_owners = {}
 
     def emulate_cycle(self):
         self.execute_opcode()
+
+    # Run one frame's worth of instructions, through the interpreter or as
+    # compiled blocks, then count down the timers. Blocks are given what is
+    # left of the frame and never run past it, so a frame of blocks runs
+    # exactly the instructions the interpreter would. Blocks are not used
+    # while anything is observing each instruction. If the program starts
+    # waiting on a key or the delay timer nothing can change until the next
+    # frame, so the rest of this one is skipped. Returns the number of
+    # instructions run.
+    def run_frame(self, blocks=False):
+        self.waiting = None
+        counter = 0
+        if blocks and not self.observers:
+            while counter < self.cycles_per_frame and not self.waiting:
+                counter += self.run_block(self.cycles_per_frame - counter)
+        else:
+            while counter < self.cycles_per_frame and not self.waiting:
+                self.execute_opcode()
+                counter += 1
         self.count_down_timers()
+        self.frame_count += 1
+        return counter
 
-    def count_down_timers(self):
+    # When the program is waiting on the delay timer, skip over the frames it
+    # would spend spinning, up to a limit. The last frame before the timer runs
+    # out is left to run, so the program reads the same values it would have.
+    # Returns the number of frames skipped.
+    def fast_forward(self, limit):
+        if self.waiting != 'timer' or self.delay_timer <= 1 or limit <= 0:
+            return 0
+        frames = min(limit, self.delay_timer - 1)
+        self.count_down_timers(frames)
+        self.frame_count += frames
+        return frames
+
+    def count_down_timers(self, ticks=1):
         if self.delay_timer > 0:
-            self.delay_timer -= 1
+            self.delay_timer = max(self.delay_timer - ticks, 0)
         if self.sound_timer > 0:
-            if self.sound_timer == 1:
-                print("\aBeep!") # The \a produces the beep!
-            self.sound_timer -= 1
+            if self.sound_timer <= ticks:
+                self.emit('beep')
+            self.sound_timer = max(self.sound_timer - ticks, 0)
 
+    # Most programs spend their time in a few tight loops, so each address is
+    # only fetched and decoded the first time it is run. Anything that writes
+    # to memory after that needs to call invalidate() for the address.
     def execute_opcode(self):
-        self.fetch_opcode()
-        self.chip8_table[(self.opcode & 0xF000) >> 12]()
+        decoded = self.decode_cache[self.program_counter]
+        if decoded is None:
+            decoded = self.decode(self.fetch_opcode())
+            self.decode_cache[self.program_counter] = decoded
+        self.opcode, handler, x, y, n, nn, nnn = decoded
+        handler(x, y, n, nn, nnn)
+
+    # Observers are told about every instruction the interpreter runs, through
+    # their before(chip8, handler) and after(chip8, handler) methods. While
+    # there are any, execute_opcode is replaced with execute_observed, so that
+    # they cost nothing once they are all detached.
+    def attach(self, observer):
+        self.observers.append(observer)
+        self.execute_opcode = self.execute_observed
+
+    def detach(self, observer):
+        self.observers.remove(observer)
+        if not self.observers:
+            del self.execute_opcode
+
+    def execute_observed(self):
+        decoded = self.decode_cache[self.program_counter]
+        if decoded is None:
+            decoded = self.decode(self.fetch_opcode())
+            self.decode_cache[self.program_counter] = decoded
+        self.opcode, handler, x, y, n, nn, nnn = decoded
+        for observer in self.observers:
+            observer.before(self, handler)
+        handler(x, y, n, nn, nnn)
+        for observer in self.observers:
+            observer.after(self, handler)
 
     def fetch_opcode(self):
-        opcode1 = int(np.uint16(self.memory[self.program_counter]))
-        opcode2 = int(np.uint16(self.memory[self.program_counter + 1]))
-        self.opcode = opcode1 << 8 | opcode2
+        self.opcode = self.read_opcode(self.program_counter)
+        return self.opcode
+
+    def read_opcode(self, address):
+        return self.memory[address] << 8 | self.memory[address + 1]
+
+    # Walk the dispatch tables for an opcode, returning the handler that will
+    # actually run it along with the X, Y, N, NN and NNN operands.
+    def decode(self, opcode):
+        x = (opcode & 0xF00) >> 8
+        y = (opcode & 0xF0) >> 4
+        n = opcode & 0xF
+        handler = self.chip8_table[(opcode & 0xF000) >> 12]
+        if handler is self.chip8_system:
+            # We have a system instruction. See what the last 4 bits are for
+            # instruction, ensuring that the second to last 4 bits are 0xE.
+            # Otherwise this 'should' call a RCA 1802 program at 0NNN, but we
+            # are not implementing that
+            if (opcode & 0xFF0) >> 4 == 0xE:
+                handler = handler[n]
+            else:
+                handler = self.cpuNULL
+        elif handler is self.chip8_arithmetic:
+            # We have some CPU Arithmetic. See what the last 4 bits are for instruction
+            handler = handler[n]
+        elif handler is self.chip8_skip or handler is self.chip8_misc:
+            handler = handler[y]
+            # FX0N and FX1N have one more table, picked by the last 4 bits
+            if handler is self.chip8_fxn or handler is self.chip8_fx1n:
+                handler = handler[n]
+        return (opcode, handler, x, y, n, opcode & 0xFF, opcode & 0xFFF)
+
+    # Forget any decoded instruction or compiled block that overlaps a memory
+    # address, as an instruction starting at the byte before it will have
+    # changed too.
+    def invalidate(self, address):
+        self.decode_cache[address] = None
+        self.decode_cache[address - 1] = None
+        for start in self.block_owners.pop(address, ()):
+            self.block_cache.pop(start, None)
+
+    # Run the compiled block at the program counter for up to a number of
+    # instructions, cycles_per_frame by default, followed by one instruction
+    # through the interpreter if that leaves any to run. Returns the number of
+    # instructions run.
+    def run_block(self, budget=None):
+        if budget is None:
+            budget = self.cycles_per_frame
+        if self.program_counter in self.block_cache:
+            block = self.block_cache[self.program_counter]
+        else:
+            block = self.compile_block(self.program_counter)
+        counter = block(self, self.v, budget) if block else 0
+        if counter < budget:
+            self.execute_opcode()
+            counter += 1
+        return counter
+
+    # Python for the instructions that can be run inside a block, with the
+    # registers held in the locals v0 to vF and I in i. Anything not in here
+    # (calls, returns, draws, timers, keys, random numbers and memory stores)
+    # ends the block.
+    block_templates = {
+        'cpu6xxx': ['v{x:X} = {nn}'],
+        'cpu7xxx': ['v{x:X} = (v{x:X} + {nn}) & 0xFF'],
+        'cpu8xx': ['v{x:X} = v{y:X}'],
+        'cpu8xx1': ['v{x:X} = v{x:X} | v{y:X}'],
+        'cpu8xx2': ['v{x:X} = v{x:X} & v{y:X}'],
+        'cpu8xx3': ['v{x:X} = v{x:X} ^ v{y:X}'],
+        'cpu8xx4': ['vF = 1 if v{y:X} > 0xFF - v{x:X} else 0', 'v{x:X} = (v{x:X} + v{y:X}) & 0xFF'],
+        'cpu8xx5': ['vF = 0 if v{x:X} < v{y:X} else 1', 'v{x:X} = (v{x:X} - v{y:X}) & 0xFF'],
+        'cpu8xx6': ['vF = v{x:X} & 0x1', 'v{x:X} = v{x:X} >> 1'],
+        'cpu8xx7': ['vF = 0 if v{y:X} < v{x:X} else 1', 'v{x:X} = (v{y:X} - v{x:X}) & 0xFF'],
+        'cpu8xxE': ['vF = v{x:X} >> 7', 'v{x:X} = (v{x:X} << 1) & 0xFF'],
+        'cpuAxxx': ['i = {nnn}'],
+        'cpuBxxx': ['i = {nnn} + v0'],
+        'cpuFx1E': ['vF = 1 if i + v{x:X} > 0xFFF else 0', 'i = (i + v{x:X}) & 0xFFF'],
+        'cpuFx2x': ['i = v{x:X} * 0x5'],
+    }
+
+    # Jumps and skips end a run of straight line code inside a block, as the
+    # next address to run
+    branch_templates = {
+        'cpu1xxx': 'pc = {nnn}',
+        'cpu3xxx': 'pc = {skip} if v{x:X} == {nn} else {next}',
+        'cpu4xxx': 'pc = {skip} if v{x:X} != {nn} else {next}',
+        'cpu5xxx': 'pc = {skip} if v{x:X} == v{y:X} else {next}',
+        'cpu9xxx': 'pc = {skip} if v{x:X} != v{y:X} else {next}',
+    }
+    # The most runs of straight line code one block will follow jumps and
+    # skips into
+    max_block_runs = 16
+
+    # Compile the code reachable from an address into one Python function,
+    # following jumps and skips, until it gets to an instruction that can't
+    # be compiled. The code is split into runs of straight line instructions,
+    # each ending in a jump or skip, and the function goes from run to run in
+    # a loop, so that whole loops of the program run without coming back out
+    # to the interpreter. A run is only started if all of it fits in the
+    # number of instructions the function is given, so it stops exactly
+    # where the interpreter would. Registers are loaded into locals once at
+    # the start, and written back once at the end. Returns the function, or
+    # None if the instruction at the address can't be compiled.
+    def compile_block(self, start):
+        runs = []
+        addresses = set()
+        work = [start]
+        seen = {start}
+        while work and len(runs) < self.max_block_runs:
+            run_start = work.pop(0)
+            lines = []
+            address = run_start
+            following = []
+            while address < 4094:
+                opcode, handler, x, y, n, nn, nnn = self.decode(self.read_opcode(address))
+                addresses.update((address, address + 1))
+                name = handler.__name__
+                if name in self.branch_templates:
+                    lines.append(self.branch_templates[name].format(
+                        x=x, y=y, nn=nn, nnn=nnn, next=address + 2, skip=address + 4))
+                    following = [nnn] if name == 'cpu1xxx' else [address + 2, address + 4]
+                    address += 2
+                    break
+                templates = self.block_templates.get(name)
+                if templates is None:
+                    lines.append('pc = %d' % address)
+                    break
+                for template in templates:
+                    lines.append(template.format(x=x, y=y, n=n, nn=nn, nnn=nnn))
+                address += 2
+            else:
+                lines.append('pc = %d' % address)
+            count = (address - run_start) // 2
+            if count:
+                runs.append((run_start, count, lines))
+            for target in following:
+                if target not in seen:
+                    seen.add(target)
+                    work.append(target)
+
+        block = None
+        if runs:
+            lines = [line for (run_start, count, run_lines) in runs for line in run_lines]
+            registers = ['v%X' % register for register in range(0, 16)
+                         if any('v%X' % register in line for line in lines)]
+            source = ['def block(chip8, v, budget):', '    i = chip8.i', '    pc = %d' % start, '    counter = 0']
+            source += ['    %s = v[%d]' % (register, int(register[1], 16)) for register in registers]
+            source += ['    while True:']
+            for (index, (run_start, count, run_lines)) in enumerate(runs):
+                source += ['        %s pc == %d and counter <= budget - %d:' % ('if' if index == 0 else 'elif', run_start, count)]
+                source += ['            ' + line for line in run_lines]
+                source += ['            counter += %d' % count]
+            source += ['        else:', '            break']
+            source += ['    v[%d] = %s' % (int(register[1], 16), register) for register in registers]
+            source += ['    chip8.i = i', '    chip8.program_counter = pc', '    return counter']
+
+            namespace = {}
+            exec(compile('\n'.join(source), '<block %03x>' % start, 'exec'), namespace)
+            block = namespace['block']
+        self.block_cache[start] = block
+        # If the program writes over its own code, the block has to go
+        for owner in addresses:
+            self.block_owners.setdefault(owner, []).append(start)
+        return block
+
+    # Things the machine reports as it runs, with the level and message they
+    # are logged with. Each one is passed the arguments given in the message.
+    events = {
+        'load': (logging.INFO, "Loading game %s, %d bytes"),
+        'beep': (logging.DEBUG, "Beep!"),
+        'unknown_opcode': (logging.WARNING, "Unknown Opcode %x at %03x"),
+    }
+    # Only the first few of each event are logged by each machine, so that a
+    # program stuck on an unknown opcode doesn't flood the log
+    log_limit = 10
+
+    # Call listener(chip8, *args) every time an event happens
+    def listen(self, event, listener):
+        self.listeners.setdefault(event, []).append(listener)
+
+    def unlisten(self, event, listener):
+        self.listeners[event].remove(listener)
+
+    # Count an event, log it if it is one of the first few, and pass it on to
+    # anything listening for it
+    def emit(self, event, *args):
+        count = self.event_counts.get(event, 0) + 1
+        self.event_counts[event] = count
+        if count <= self.log_limit:
+            level, message = self.events[event]
+            logger.log(level, message, *args)
+            if count == self.log_limit:
+                logger.log(level, "Not logging any more %s events", event)
+        for listener in self.listeners.get(event, ()):
+            listener(self, *args)
 
     def set_keys(self):
         print("Setting Keys")
 
-    # We have a failed instruction. Skip it, move on, but echo it out to the screen.
-    def cpuNULL(self):
+    # We have a failed instruction. Skip it, move on, but report it.
+    def cpuNULL(self, x, y, n, nn, nnn):
         # We are either not implementing an opcode, or there is a programming
         # error, hopefully on the src rom, and not here.
-        print("Unknown Opcode %x" % self.opcode)
+        self.emit('unknown_opcode', self.opcode, self.program_counter)
         self.program_counter += 2
 
-    def cpu0xxx(self):
-        # We have a system instruction. See what the last 4 bits are for
-        # instruction, ensuring that the second to last 4 bits are 0xE
-        if (self.opcode & 0xFF0) >> 4 == 0xE:
-            self.chip8_system[(self.opcode & 0xF)]()
-        else:
-            # This 'should' call a RCA 1802 program at 0NNN, but we are
-            # not implementing that
-            self.cpuNULL()
-
     # 00E0 - Clear the screen
-    def cpu00E0(self):
+    def cpu00E0(self, x, y, n, nn, nnn):
         self.clear_screen()
         self.program_counter += 2
 
     # 00EE - Return from a sub routine
-    def cpu00EE(self):
+    def cpu00EE(self, x, y, n, nn, nnn):
+        # Raised before anything changes, as 2NNN does when the stack is full,
+        # rather than wrapping round to the top of the stack
+        if self.stack_pointer == 0:
+            raise IndexError("Return with an empty stack")
         self.stack_pointer -= 1
         self.program_counter = self.stack[self.stack_pointer]
         self.program_counter += 2
 
     # 1NNN - Jumps to Address NNN
-    def cpu1xxx(self):
-        self.program_counter = (self.opcode & 0xFFF)
+    def cpu1xxx(self, x, y, n, nn, nnn):
+        self.program_counter = nnn
 
     # 2NNN - Call subroutine at NNN
-    def cpu2xxx(self):
+    def cpu2xxx(self, x, y, n, nn, nnn):
         self.stack[self.stack_pointer] = self.program_counter
         self.stack_pointer += 1
-        self.program_counter = (self.opcode & 0xFFF)
+        self.program_counter = nnn
 
     # 3XNN - Skips next instruction if VX == NN
-    def cpu3xxx(self):
-        if self.v[(self.opcode & 0xF00) >> 8] == (self.opcode & 0xFF):
+    def cpu3xxx(self, x, y, n, nn, nnn):
+        if self.v[x] == nn:
             self.program_counter += 4
         else:
             self.program_counter += 2
 
     # 4XNN - Skips next instruction if VX != NN
-    def cpu4xxx(self):
-        if self.v[(self.opcode & 0xF00) >> 8] != (self.opcode & 0xFF):
+    def cpu4xxx(self, x, y, n, nn, nnn):
+        if self.v[x] != nn:
             self.program_counter += 4
         else:
             self.program_counter += 2
 
     # 5XY0 - Skips next instruction if VX == VY
     # This might possibly bug as it will accept any final 4 bit value, and not just 0
-    def cpu5xxx(self):
-        if self.v[(self.opcode & 0xF00) >> 8] == self.v[(self.opcode & 0xF0) >> 4]:
+    def cpu5xxx(self, x, y, n, nn, nnn):
+        if self.v[x] == self.v[y]:
             self.program_counter += 4
         else:
             self.program_counter += 2
 
     # 6XNN - Sets VX to NN
-    def cpu6xxx(self):
-        self.v[(self.opcode & 0xF00) >> 8] = (self.opcode & 0xFF)
+    def cpu6xxx(self, x, y, n, nn, nnn):
+        self.v[x] = nn
         self.program_counter += 2
 
     # 7XNN - Adds NN to VX
-    def cpu7xxx(self):
-        self.v[(self.opcode & 0xF00) >> 8] = self.v[(self.opcode & 0xF00) >> 8] + (self.opcode & 0xFF)
+    def cpu7xxx(self, x, y, n, nn, nnn):
         # Ensure that the value is still 8bit.
-        self.v[(self.opcode & 0xF00) >> 8] = self.v[(self.opcode & 0xF00) >> 8] & 0xFF
+        self.v[x] = (self.v[x] + nn) & 0xFF
         self.program_counter += 2
 
-    # No Instruction yet
-    def cpu8xxx(self):
-        # We have some CPU Arithmetic. See what the last 4 bits are for instruction
-        self.chip8_arithmetic[(self.opcode & 0xF)]()
-
     # 8XY0 - Sets VX to the value of VY
-    def cpu8xx(self):
-        self.v[(self.opcode & 0xF00) >> 8] = self.v[(self.opcode & 0xF0) >> 4]
+    def cpu8xx(self, x, y, n, nn, nnn):
+        self.v[x] = self.v[y]
         self.program_counter += 2
 
     # 8XY1 - Sets VX to the value of VX OR VY
-    def cpu8xx1(self):
-        self.v[(self.opcode & 0xF00) >> 8] = self.v[(self.opcode & 0xF00) >> 8] | self.v[(self.opcode & 0xF0) >> 4]
+    def cpu8xx1(self, x, y, n, nn, nnn):
+        self.v[x] = self.v[x] | self.v[y]
         self.program_counter += 2
 
     # 8XY2 - Sets VX to the value of VX AND VY
-    def cpu8xx2(self):
-        self.v[(self.opcode & 0xF00) >> 8] = self.v[(self.opcode & 0xF00) >> 8] & self.v[(self.opcode & 0xF0) >> 4]
+    def cpu8xx2(self, x, y, n, nn, nnn):
+        self.v[x] = self.v[x] & self.v[y]
         self.program_counter += 2
 
     # 8XY3 - Sets VX to the value of VX XOR VY
-    def cpu8xx3(self):
-        self.v[(self.opcode & 0xF00) >> 8] = self.v[(self.opcode & 0xF00) >> 8] ^ self.v[(self.opcode & 0xF0) >> 4]
+    def cpu8xx3(self, x, y, n, nn, nnn):
+        self.v[x] = self.v[x] ^ self.v[y]
         self.program_counter += 2
 
     # 8XY4 - Adds VY to VX. VF is set to 1 if there is a carry. Else 0
-    def cpu8xx4(self):
-        if self.v[(self.opcode & 0xF0) >> 4] > (0xFF - self.v[(self.opcode & 0xF00) >> 8]):
+    def cpu8xx4(self, x, y, n, nn, nnn):
+        if self.v[y] > (0xFF - self.v[x]):
             self.v[0xF] = 0x1
         else:
             self.v[0xF] = 0x0
-        self.v[(self.opcode & 0xF00) >> 8] = self.v[(self.opcode & 0xF00) >> 8] + self.v[(self.opcode & 0xF0) >> 4]
-        self.v[(self.opcode & 0xF00) >> 8] = self.v[(self.opcode & 0xF00) >> 8] & 0xFF
+        self.v[x] = (self.v[x] + self.v[y]) & 0xFF
         self.program_counter += 2
 
     # 8XY5 - Subtracts VY from VX. VF is set to 0 if there is a borrow. Else 1
-    def cpu8xx5(self):
-        if self.v[(self.opcode & 0xF00) >> 8] < self.v[(self.opcode & 0xF0) >> 4]:
+    def cpu8xx5(self, x, y, n, nn, nnn):
+        if self.v[x] < self.v[y]:
             self.v[0xF] = 0x0
         else:
             self.v[0xF] = 0x1
@@ -252,174 +725,577 @@ class Chip8:
         # self.v[(self.opcode & 0xF00) >> 8] -= self.v[(self.opcode & 0xF0) >> 4]
         # was causing V7 to be affected in addition to V0 when running 8015
         # Totally wierd bug there, but I don't think it is mine.
-        self.v[(self.opcode & 0xF00) >> 8] = self.v[(self.opcode & 0xF00) >> 8] - self.v[(self.opcode & 0xF0) >> 4]
-        self.v[(self.opcode & 0xF00) >> 8] = self.v[(self.opcode & 0xF00) >> 8] & 0xFF
+        self.v[x] = (self.v[x] - self.v[y]) & 0xFF
         self.program_counter += 2
 
     # 8XY6 - Shifts VX right by 1. VF is set to LSB of VX before the shift.
     # Not really sure what the Y in this is for.
-    def cpu8xx6(self):
-        self.v[0xF] = self.v[(self.opcode & 0xF00) >> 8] & 0x1
-        self.v[(self.opcode & 0xF00) >> 8] = self.v[(self.opcode & 0xF00) >> 8] >> 0x1
+    def cpu8xx6(self, x, y, n, nn, nnn):
+        self.v[0xF] = self.v[x] & 0x1
+        self.v[x] = self.v[x] >> 0x1
         self.program_counter += 2
 
     # 8XY7 - Sets VX to the value of VY minus VX
-    def cpu8xx7(self):
-        if self.v[(self.opcode & 0xF0) >> 4] < self.v[(self.opcode & 0xF00) >> 8]:
+    def cpu8xx7(self, x, y, n, nn, nnn):
+        if self.v[y] < self.v[x]:
             self.v[0xF] = 0x0
         else:
             self.v[0xF] = 0x1
-        self.v[(self.opcode & 0xF00) >> 8] = self.v[(self.opcode & 0xF0) >> 4] - self.v[(self.opcode & 0xF00) >> 8]
-        self.v[(self.opcode & 0xF00) >> 8] = self.v[(self.opcode & 0xF00) >> 8] & 0xFF
+        self.v[x] = (self.v[y] - self.v[x]) & 0xFF
         self.program_counter += 2
 
     # 8XYE - Shifts VX left by 1. VF is set to MSB of VX before the shift.
     # Not really sure what the Y in this is for.
-    def cpu8xxE(self):
-        self.v[0xF] = self.v[(self.opcode & 0xF00) >> 8] >> 7
-        self.v[(self.opcode & 0xF00) >> 8] = self.v[(self.opcode & 0xF00) >> 8] << 1
-        self.v[(self.opcode & 0xF00) >> 8] = self.v[(self.opcode & 0xF00) >> 8] & 0xFF
+    def cpu8xxE(self, x, y, n, nn, nnn):
+        self.v[0xF] = self.v[x] >> 7
+        self.v[x] = (self.v[x] << 1) & 0xFF
         self.program_counter += 2
 
     # 9XY0 - Skips the next instruction if VX doesn't equal VY
-    def cpu9xxx(self):
-        if self.v[(self.opcode & 0xF00) >> 8] != self.v[(self.opcode & 0xF0) >> 4]:
+    def cpu9xxx(self, x, y, n, nn, nnn):
+        if self.v[x] != self.v[y]:
             self.program_counter += 4
         else:
             self.program_counter += 2
 
     # ANNN - Sets I to address NNN
-    def cpuAxxx(self):
-        self.i = self.opcode & 0xFFF
+    def cpuAxxx(self, x, y, n, nn, nnn):
+        self.i = nnn
         self.program_counter += 2
 
     # BNNN - Jumps to the address NNN + V0
-    def cpuBxxx(self):
-        self.i = (self.opcode & 0xFFF) + self.v[0x0]
+    def cpuBxxx(self, x, y, n, nn, nnn):
+        self.i = nnn + self.v[0x0]
         self.program_counter += 2
 
     # CXNN - Sets VX to a random number AND NN
-    def cpuCxxx(self):
-        ran = random.Random()
-        if self.test_rand:
-            ran.seed(123)
-        self.v[(self.opcode & 0xF00) >> 8] = (self.opcode & 0xFF) & ran.randint(0x0, 0xFF)
+    def cpuCxxx(self, x, y, n, nn, nnn):
+        self.v[x] = nn & self.random.getrandbits(8)
         self.program_counter += 2
 
     # DXYN - Draws a sprite at coordinate XV,XY that is 8 pixels wide and N pixels tall and starting at location I
     # VF is set to one if any pixels are set from 1 to 0.
-    def cpuDxxx(self):
-        x = self.v[(self.opcode & 0xF00) >> 8]
-        y = self.v[(self.opcode & 0xF0) >> 4]
-        height = self.opcode & 0xF
-
-        self.v[0xF] = 0
-        for y_line in range(0, height):
-            pixel = self.memory[self.i + y_line]
-            for x_line in range(0, 8):
-                if (pixel & (0x80 >> x_line)) != 0:
-                    v_byte = (x + x_line + ((y + y_line) * self.screen_width))
-                    # Cheap fix. v_byte should never be 2048 or above, but for some reason it is.
-                    # if we skip it when this happens. we are all ok. Otherwise, crashville.
-                    if v_byte < 2048:
-                        if self.graphics[v_byte] == 1:
-                            self.v[0xF] = 1
-                        self.graphics[v_byte] ^= 1
-                    else:
-                        sys.exit()
+    # The coordinates wrap around onto the screen, but any of the sprite that
+    # then goes off the right or the bottom is clipped.
+    def cpuDxxx(self, x, y, n, nn, nnn):
+        x = self.v[x] % self.screen_width
+        y = self.v[y] % self.screen_height
+        height = min(n, self.screen_height - y)
+        width = min(8, self.screen_width - x)
+
+        sprite = np.frombuffer(self.memory, dtype=np.uint8, count=height, offset=self.i)
+        sprite = np.unpackbits(sprite).reshape(height, 8)[:, :width]
+        region = self.screen[y:y + height, x:x + width]
+        self.v[0xF] = 1 if (region & sprite).any() else 0
+        region ^= sprite
+        # Every pixel the sprite has set is flipped, so its key goes in or out
+        mask = 0xFF00 >> width & 0xFF
+        digest = self.screen_digest
+        for row in range(0, height):
+            bits = self.memory[self.i + row] & mask
+            if bits:
+                keys = self.nibble_keys[y + row]
+                digest ^= keys[x][bits >> 4] ^ keys[x + 4][bits & 0xF]
+        self.screen_digest = digest
 
         self.program_counter += 2
         self.draw_flag = True
-
-    def cpuExxx(self):
-        self.chip8_skip[(self.opcode & 0xF0) >> 4]()
+        self.generation += 1
+        self.row_generations[y:y + height] = self.generation
 
     # EX9E - Skips next instruction is key stored in VX is pressed.
     # This might possibly bug as it will accept any final 4 bit value, and not just E
-    def cpuEx9x(self):
-        if self.key[self.v[(self.opcode & 0xF00) >> 8]] != 0x0:
+    def cpuEx9x(self, x, y, n, nn, nnn):
+        if self.key[self.v[x]] != 0x0:
             self.program_counter += 2
         self.program_counter += 2
 
     # EXA1 - Skips next instruction is key stored in VX isn't pressed.
     # This might possibly bug as it will accept any final 4 bit value, and not just 1
-    def cpuExAx(self):
-        if self.key[self.v[(self.opcode & 0xF00) >> 8]] == 0x0:
+    def cpuExAx(self, x, y, n, nn, nnn):
+        if self.key[self.v[x]] == 0x0:
             self.program_counter += 2
         self.program_counter += 2
 
-    def cpuFxxx(self):
-        self.chip8_misc[(self.opcode & 0xF0) >> 4]()
-
-    def cpuFxx(self):
-        self.chip8_fxn[(self.opcode & 0xF)]()
-
     # Fx7 - Sets VX to the value of the delay timer
-    def cpuFx7(self):
-        self.v[(self.opcode & 0xF00) >> 8] = self.delay_timer
+    def cpuFx7(self, x, y, n, nn, nnn):
+        self.v[x] = self.delay_timer
+        if self.delay_timer and self.is_timer_wait(self.program_counter, x):
+            self.waiting = 'timer'
         self.program_counter += 2
 
+    # FX07 followed by 3X00 and a jump back to the FX07 is a program spinning
+    # until the delay timer runs out
+    def is_timer_wait(self, address, x):
+        return (address + 6 <= len(self.memory)
+                and self.read_opcode(address + 2) == 0x3000 | x << 8
+                and self.read_opcode(address + 4) == 0x1000 | address)
+
     # FxA - A key press is awaited and stored in VX
-    def cpuFxA(self):
-        key_press = False
-        for i in range (0, 0xF):
-            if self.key[i] == 1:
-                self.v[(self.opcode & 0xF00) >> 8] = i
-                key_press = True
-        if key_press:
+    def cpuFxA(self, x, y, n, nn, nnn):
+        key = self.key.rfind(1, 0, 0xF)
+        if key != -1:
+            self.v[x] = key
             self.program_counter += 2
-
-    def cpuFx1x(self):
-        self.chip8_fx1n[(self.opcode & 0xF)]()
+        else:
+            self.waiting = 'key'
 
     # FX15 - Sets the delay timer to VX
-    def cpuFx15(self):
-        self.delay_timer = self.v[(self.opcode & 0xF00) >> 8]
+    def cpuFx15(self, x, y, n, nn, nnn):
+        self.delay_timer = self.v[x]
         self.program_counter += 2
 
     # FX18 - Sets the sound timer to VX
-    def cpuFx18(self):
-        self.sound_timer = self.v[(self.opcode & 0xF00) >> 8]
+    def cpuFx18(self, x, y, n, nn, nnn):
+        self.sound_timer = self.v[x]
         self.program_counter += 2
 
     # FX1E - Adds VX to I
-    def cpuFx1E(self):
-        if self.i + self.v[(self.opcode & 0xF00) >> 8] > 0xFFF:
+    def cpuFx1E(self, x, y, n, nn, nnn):
+        if self.i + self.v[x] > 0xFFF:
             self.v[0xF] = 1
         else:
             self.v[0xF] = 0
-        self.i += self.v[(self.opcode & 0xF00) >> 8]
+        self.i += self.v[x]
         self.i &= 0xFFF
         self.program_counter += 2
 
     # FX29 - Sets I to the location of the sprite for the character in VX
     # This might possibly bug as it will accept any final 4 bit value, and not just 9
     # I took this from another example. I will come back to look at it later
-    def cpuFx2x(self):
-        self.i = self.v[(self.opcode & 0xF00) >> 8] * 0x5
+    def cpuFx2x(self, x, y, n, nn, nnn):
+        self.i = self.v[x] * 0x5
         self.program_counter += 2
 
     # FX33 - Stores the BCD representation of VX at I, I+1 and I+2
     # This might possibly bug as it will accept any final 4 bit value, and not just 3
     # Taken from elsewhere
-    def cpuFx3x(self):
-        self.memory[self.i] = self.v[(self.opcode & 0xF00) >> 8] / 100
-        self.memory[self.i + 1] = (self.v[(self.opcode & 0xF00) >> 8] / 10) % 10
-        self.memory[self.i + 2] = (self.v[(self.opcode & 0xF00) >> 8] % 100) % 10
+    def cpuFx3x(self, x, y, n, nn, nnn):
+        self.memory[self.i] = self.v[x] // 100
+        self.memory[self.i + 1] = (self.v[x] // 10) % 10
+        self.memory[self.i + 2] = (self.v[x] % 100) % 10
+        for counter in range(0, 3):
+            self.invalidate(self.i + counter)
         self.program_counter += 2
 
     # FX55 - Stores V0 to VX in memory starting at address I
     # This might possibly bug as it will accept any final 4 bit value, and not just 5
-    def cpuFx5x(self):
-        for counter in range(0, ((self.opcode & 0xF00) >> 8) + 1):
+    def cpuFx5x(self, x, y, n, nn, nnn):
+        for counter in range(0, x + 1):
             self.memory[self.i + counter] = self.v[counter]
+            self.invalidate(self.i + counter)
         self.i = self.i + (self.opcode & 0xF00 >> 8) + 1
         self.program_counter += 2
 
     # FX65 - Fills V0 to VX with values from memory starting at address I
     # This might possibly bug as it will accept any final 4 bit value, and not just 5
-    def cpuFx6x(self):
-        for counter in range(0, ((self.opcode & 0xF00) >> 8) + 1):
+    def cpuFx6x(self, x, y, n, nn, nnn):
+        for counter in range(0, x + 1):
             self.v[counter] = self.memory[self.i + counter]
         self.i = self.i + (self.opcode & 0xF00 >> 8) + 1
         self.program_counter += 2
+
+
+# Many machines running the same way as Chip8, stepped together in lock-step.
+# The state of every machine is held in numpy arrays with one row per machine,
+# and each step applies every opcode that any machine is running as a single
+# masked operation over the machines running it. The handlers mirror those in
+# Chip8, but take arrays of machines and operands instead of single values.
+class Chip8Batch:
+    screen_width = Chip8.screen_width
+    screen_height = Chip8.screen_height
+    max_game_size = Chip8.max_game_size
+    timer_hz = Chip8.timer_hz
+    cycles_per_frame = Chip8.cycles_per_frame
+    font_set = Chip8.font_set
+
+    # Each machine has its own XorShift for CXNN, as Chip8 does, run for all
+    # the machines at once. The seeds are a list with one for each machine,
+    # or one seed for the first machine, with each one after it seeded with
+    # one more. A machine seeded with a number gets the same random numbers
+    # as a Chip8 seeded with it.
+    def __init__(self, count, seed=None):
+        self.count = count
+        self.lanes = np.arange(count)
+        if seed is None:
+            seed = random.getrandbits(32)
+        if isinstance(seed, int):
+            seed = range(seed, seed + count)
+        self.seeds = list(seed)
+        if len(self.seeds) != count:
+            raise ValueError("%d seeds given for %d machines" % (len(self.seeds), count))
+        self.random_state = np.zeros(count, dtype=np.uint32)
+
+        self.memory = np.zeros((count, 4096), dtype=np.uint8)
+        self.v = np.zeros((count, 16), dtype=np.uint8)
+        self.key = np.zeros((count, 16), dtype=np.uint8)
+        self.stack = np.zeros((count, 16), dtype=np.int32)
+        self.graphics = np.zeros((count, self.screen_height, self.screen_width), dtype=np.uint8)
+        self.program_counter = np.zeros(count, dtype=np.int32)
+        self.i = np.zeros(count, dtype=np.int32)
+        self.stack_pointer = np.zeros(count, dtype=np.int32)
+        self.delay_timer = np.zeros(count, dtype=np.int32)
+        self.sound_timer = np.zeros(count, dtype=np.int32)
+        self.draw_flag = np.zeros(count, dtype=bool)
+
+    def initialise(self):
+        self.reset()
+        self.setup_opcode_pointers()
+
+    def setup_opcode_pointers(self):
+        self.chip8_system = [
+            self.cpu00E0, self.cpuNULL, self.cpuNULL, self.cpuNULL,
+            self.cpuNULL, self.cpuNULL, self.cpuNULL, self.cpuNULL,
+            self.cpuNULL, self.cpuNULL, self.cpuNULL, self.cpuNULL,
+            self.cpuNULL, self.cpuNULL, self.cpu00EE, self.cpuNULL,
+        ]
+        self.chip8_arithmetic = [
+            self.cpu8xx, self.cpu8xx1, self.cpu8xx2, self.cpu8xx3,
+            self.cpu8xx4, self.cpu8xx5, self.cpu8xx6, self.cpu8xx7,
+            self.cpuNULL, self.cpuNULL, self.cpuNULL, self.cpuNULL,
+            self.cpuNULL, self.cpuNULL, self.cpu8xxE, self.cpuNULL,
+        ]
+        self.chip8_skip = [
+            self.cpuNULL, self.cpuNULL, self.cpuNULL, self.cpuNULL,
+            self.cpuNULL, self.cpuNULL, self.cpuNULL, self.cpuNULL,
+            self.cpuNULL, self.cpuEx9x, self.cpuExAx, self.cpuNULL,
+            self.cpuNULL, self.cpuNULL, self.cpuNULL, self.cpuNULL,
+        ]
+        self.chip8_fxn = [
+            self.cpuNULL, self.cpuNULL, self.cpuNULL, self.cpuNULL,
+            self.cpuNULL, self.cpuNULL, self.cpuNULL, self.cpuFx7,
+            self.cpuNULL, self.cpuNULL, self.cpuFxA, self.cpuNULL,
+            self.cpuNULL, self.cpuNULL, self.cpuNULL, self.cpuNULL,
+        ]
+        self.chip8_fx1n = [
+            self.cpuNULL, self.cpuNULL, self.cpuNULL, self.cpuNULL,
+            self.cpuNULL, self.cpuFx15, self.cpuNULL, self.cpuNULL,
+            self.cpuFx18, self.cpuNULL, self.cpuNULL, self.cpuNULL,
+            self.cpuNULL, self.cpuNULL, self.cpuFx1E, self.cpuNULL,
+        ]
+        self.chip8_misc = [
+            self.cpuFxx, self.cpuFx1x, self.cpuFx2x, self.cpuFx3x,
+            self.cpuNULL, self.cpuFx5x, self.cpuFx6x, self.cpuNULL,
+            self.cpuNULL, self.cpuNULL, self.cpuNULL, self.cpuNULL,
+            self.cpuNULL, self.cpuNULL, self.cpuNULL, self.cpuNULL,
+        ]
+        self.chip8_table = [
+            self.cpu0xxx, self.cpu1xxx, self.cpu2xxx, self.cpu3xxx,
+            self.cpu4xxx, self.cpu5xxx, self.cpu6xxx, self.cpu7xxx,
+            self.cpu8xxx, self.cpu9xxx, self.cpuAxxx, self.cpuBxxx,
+            self.cpuCxxx, self.cpuDxxx, self.cpuExxx, self.cpuFxxx,
+        ]
+
+    def reset(self):
+        self.program_counter[:] = 0x200 # Program starts at 0x200
+        self.i[:] = 0
+        self.stack_pointer[:] = 0
+        self.stack[:] = 0
+        self.v[:] = 0
+        self.key[:] = 0
+        self.memory[:] = 0
+        self.memory[:, 0:len(self.font_set)] = self.font_set
+        self.graphics[:] = 0
+        self.draw_flag[:] = True
+        self.delay_timer[:] = 0
+        self.sound_timer[:] = 0
+        self.random_state[:] = [XorShift(seed).state for seed in self.seeds]
+
+    # The next 8 random bits for each of some machines, from the same 32 bit
+    # xorshift as XorShift.getrandbits
+    def random_bytes(self, m):
+        x = self.random_state[m]
+        x ^= x << 13
+        x ^= x >> 17
+        x ^= x << 5
+        self.random_state[m] = x
+        return x >> 24
+
+    # Load the same game, from a file path or a buffer, into every machine
+    def load_game(self, game):
+        if isinstance(game, (str, os.PathLike)):
+            with open(game, 'rb') as game_file:
+                game = game_file.read(self.max_game_size + 1)
+        game = np.frombuffer(game, dtype=np.uint8)
+        if len(game) > self.max_game_size:
+            raise ValueError("Game is %d bytes, but only %d will fit in memory" % (len(game), self.max_game_size))
+        self.memory[:, 0x200:0x200 + len(game)] = game
+        return len(game)
+
+    def run_frame(self):
+        for counter in range(0, self.cycles_per_frame):
+            self.execute_opcode()
+        self.count_down_timers()
+        return self.cycles_per_frame
+
+    def count_down_timers(self):
+        np.maximum(self.delay_timer - 1, 0, out=self.delay_timer)
+        np.maximum(self.sound_timer - 1, 0, out=self.sound_timer)
+
+    # Fetch and decode an opcode for every machine, then run each handler
+    # once for all the machines that need it
+    def execute_opcode(self):
+        pc = self.program_counter
+        opcode = self.memory[self.lanes, pc].astype(np.int32) << 8 | self.memory[self.lanes, (pc + 1) & 0xFFF]
+        self.dispatch(self.chip8_table, opcode >> 12, self.lanes, opcode)
+
+    # Split machines up by selector, and run the handler for each group
+    def dispatch(self, table, selector, m, opcode):
+        keys = np.unique(selector)
+        if len(keys) == 1:
+            table[keys[0]](m, opcode)
+            return
+        for key in keys:
+            chosen = selector == key
+            table[key](m[chosen], opcode[chosen])
+
+    def cpuNULL(self, m, opcode):
+        self.program_counter[m] += 2
+
+    def cpu0xxx(self, m, opcode):
+        # We only have 00EX system instructions, the rest would call an
+        # RCA 1802 program
+        system = (opcode & 0xFF0) == 0xE0
+        self.cpuNULL(m[~system], opcode[~system])
+        if system.any():
+            self.dispatch(self.chip8_system, opcode[system] & 0xF, m[system], opcode[system])
+
+    # 00E0 - Clear the screen
+    def cpu00E0(self, m, opcode):
+        self.graphics[m] = 0
+        self.draw_flag[m] = True
+        self.program_counter[m] += 2
+
+    # 00EE - Return from a sub routine
+    def cpu00EE(self, m, opcode):
+        if not self.stack_pointer[m].all():
+            raise IndexError("Return with an empty stack")
+        self.stack_pointer[m] -= 1
+        self.program_counter[m] = self.stack[m, self.stack_pointer[m]] + 2
+
+    # 1NNN - Jumps to Address NNN
+    def cpu1xxx(self, m, opcode):
+        self.program_counter[m] = opcode & 0xFFF
+
+    # 2NNN - Call subroutine at NNN
+    def cpu2xxx(self, m, opcode):
+        self.stack[m, self.stack_pointer[m]] = self.program_counter[m]
+        self.stack_pointer[m] += 1
+        self.program_counter[m] = opcode & 0xFFF
+
+    # 3XNN - Skips next instruction if VX == NN
+    def cpu3xxx(self, m, opcode):
+        self.program_counter[m] += np.where(self.v[m, (opcode & 0xF00) >> 8] == (opcode & 0xFF), 4, 2)
+
+    # 4XNN - Skips next instruction if VX != NN
+    def cpu4xxx(self, m, opcode):
+        self.program_counter[m] += np.where(self.v[m, (opcode & 0xF00) >> 8] != (opcode & 0xFF), 4, 2)
+
+    # 5XY0 - Skips next instruction if VX == VY
+    def cpu5xxx(self, m, opcode):
+        self.program_counter[m] += np.where(self.v[m, (opcode & 0xF00) >> 8] == self.v[m, (opcode & 0xF0) >> 4], 4, 2)
+
+    # 6XNN - Sets VX to NN
+    def cpu6xxx(self, m, opcode):
+        self.v[m, (opcode & 0xF00) >> 8] = opcode & 0xFF
+        self.program_counter[m] += 2
+
+    # 7XNN - Adds NN to VX
+    def cpu7xxx(self, m, opcode):
+        x = (opcode & 0xF00) >> 8
+        self.v[m, x] = (self.v[m, x] + (opcode & 0xFF)) & 0xFF
+        self.program_counter[m] += 2
+
+    def cpu8xxx(self, m, opcode):
+        self.dispatch(self.chip8_arithmetic, opcode & 0xF, m, opcode)
+
+    # The arithmetic handlers write VF before reading VX and VY again, as
+    # Chip8 does, so that they agree when X or Y is F.
+
+    # 8XY0 - Sets VX to the value of VY
+    def cpu8xx(self, m, opcode):
+        self.v[m, (opcode & 0xF00) >> 8] = self.v[m, (opcode & 0xF0) >> 4]
+        self.program_counter[m] += 2
+
+    # 8XY1 - Sets VX to the value of VX OR VY
+    def cpu8xx1(self, m, opcode):
+        x, y = (opcode & 0xF00) >> 8, (opcode & 0xF0) >> 4
+        self.v[m, x] = self.v[m, x] | self.v[m, y]
+        self.program_counter[m] += 2
+
+    # 8XY2 - Sets VX to the value of VX AND VY
+    def cpu8xx2(self, m, opcode):
+        x, y = (opcode & 0xF00) >> 8, (opcode & 0xF0) >> 4
+        self.v[m, x] = self.v[m, x] & self.v[m, y]
+        self.program_counter[m] += 2
+
+    # 8XY3 - Sets VX to the value of VX XOR VY
+    def cpu8xx3(self, m, opcode):
+        x, y = (opcode & 0xF00) >> 8, (opcode & 0xF0) >> 4
+        self.v[m, x] = self.v[m, x] ^ self.v[m, y]
+        self.program_counter[m] += 2
+
+    # 8XY4 - Adds VY to VX. VF is set to 1 if there is a carry. Else 0
+    def cpu8xx4(self, m, opcode):
+        x, y = (opcode & 0xF00) >> 8, (opcode & 0xF0) >> 4
+        self.v[m, 0xF] = self.v[m, y].astype(np.int32) > 0xFF - self.v[m, x]
+        self.v[m, x] = (self.v[m, x].astype(np.int32) + self.v[m, y]) & 0xFF
+        self.program_counter[m] += 2
+
+    # 8XY5 - Subtracts VY from VX. VF is set to 0 if there is a borrow. Else 1
+    def cpu8xx5(self, m, opcode):
+        x, y = (opcode & 0xF00) >> 8, (opcode & 0xF0) >> 4
+        self.v[m, 0xF] = self.v[m, x] >= self.v[m, y]
+        self.v[m, x] = (self.v[m, x].astype(np.int32) - self.v[m, y]) & 0xFF
+        self.program_counter[m] += 2
+
+    # 8XY6 - Shifts VX right by 1. VF is set to LSB of VX before the shift.
+    def cpu8xx6(self, m, opcode):
+        x = (opcode & 0xF00) >> 8
+        self.v[m, 0xF] = self.v[m, x] & 0x1
+        self.v[m, x] = self.v[m, x] >> 0x1
+        self.program_counter[m] += 2
+
+    # 8XY7 - Sets VX to the value of VY minus VX
+    def cpu8xx7(self, m, opcode):
+        x, y = (opcode & 0xF00) >> 8, (opcode & 0xF0) >> 4
+        self.v[m, 0xF] = self.v[m, y] >= self.v[m, x]
+        self.v[m, x] = (self.v[m, y].astype(np.int32) - self.v[m, x]) & 0xFF
+        self.program_counter[m] += 2
+
+    # 8XYE - Shifts VX left by 1. VF is set to MSB of VX before the shift.
+    def cpu8xxE(self, m, opcode):
+        x = (opcode & 0xF00) >> 8
+        self.v[m, 0xF] = self.v[m, x] >> 7
+        self.v[m, x] = (self.v[m, x].astype(np.int32) << 1) & 0xFF
+        self.program_counter[m] += 2
+
+    # 9XY0 - Skips the next instruction if VX doesn't equal VY
+    def cpu9xxx(self, m, opcode):
+        self.program_counter[m] += np.where(self.v[m, (opcode & 0xF00) >> 8] != self.v[m, (opcode & 0xF0) >> 4], 4, 2)
+
+    # ANNN - Sets I to address NNN
+    def cpuAxxx(self, m, opcode):
+        self.i[m] = opcode & 0xFFF
+        self.program_counter[m] += 2
+
+    # BNNN - Sets I to NNN + V0, as Chip8 does
+    def cpuBxxx(self, m, opcode):
+        self.i[m] = (opcode & 0xFFF) + self.v[m, 0x0]
+        self.program_counter[m] += 2
+
+    # CXNN - Sets VX to a random number AND NN
+    def cpuCxxx(self, m, opcode):
+        self.v[m, (opcode & 0xF00) >> 8] = (opcode & 0xFF) & self.random_bytes(m)
+        self.program_counter[m] += 2
+
+    # DXYN - Draws a sprite at coordinate XV,XY that is 8 pixels wide and N pixels tall and starting at location I
+    # VF is set to one if any pixels are set from 1 to 0. Every row of every
+    # sprite is unpacked at once, and the pixels that are set and on screen
+    # are XORed in with a single scatter.
+    def cpuDxxx(self, m, opcode):
+        x = self.v[m, (opcode & 0xF00) >> 8].astype(np.int32) % self.screen_width
+        y = self.v[m, (opcode & 0xF0) >> 4].astype(np.int32) % self.screen_height
+        rows = np.arange(0, 15)
+        addresses = (self.i[m, None] + rows) & 0xFFF
+        sprite = np.unpackbits(self.memory[m[:, None], addresses][:, :, None], axis=2)
+        pixel_x = x[:, None, None] + np.arange(0, 8)
+        pixel_y = y[:, None, None] + rows[:, None]
+        drawn = ((sprite == 1)
+                 & (rows[:, None] < (opcode & 0xF)[:, None, None])
+                 & (pixel_x < self.screen_width)
+                 & (pixel_y < self.screen_height))
+        lanes = np.broadcast_to(m[:, None, None], drawn.shape)[drawn]
+        pixel_x, pixel_y = np.broadcast_to(pixel_x, drawn.shape)[drawn], np.broadcast_to(pixel_y, drawn.shape)[drawn]
+
+        collision = np.zeros(self.count, dtype=bool)
+        collision[lanes[self.graphics[lanes, pixel_y, pixel_x] == 1]] = True
+        self.graphics[lanes, pixel_y, pixel_x] ^= 1
+        self.v[m, 0xF] = collision[m]
+        self.program_counter[m] += 2
+        self.draw_flag[m] = True
+
+    def cpuExxx(self, m, opcode):
+        self.dispatch(self.chip8_skip, (opcode & 0xF0) >> 4, m, opcode)
+
+    # EX9E - Skips next instruction is key stored in VX is pressed.
+    def cpuEx9x(self, m, opcode):
+        pressed = self.key[m, self.v[m, (opcode & 0xF00) >> 8] & 0xF] != 0x0
+        self.program_counter[m] += np.where(pressed, 4, 2)
+
+    # EXA1 - Skips next instruction is key stored in VX isn't pressed.
+    def cpuExAx(self, m, opcode):
+        pressed = self.key[m, self.v[m, (opcode & 0xF00) >> 8] & 0xF] != 0x0
+        self.program_counter[m] += np.where(pressed, 2, 4)
+
+    def cpuFxxx(self, m, opcode):
+        self.dispatch(self.chip8_misc, (opcode & 0xF0) >> 4, m, opcode)
+
+    def cpuFxx(self, m, opcode):
+        self.dispatch(self.chip8_fxn, opcode & 0xF, m, opcode)
+
+    def cpuFx1x(self, m, opcode):
+        self.dispatch(self.chip8_fx1n, opcode & 0xF, m, opcode)
+
+    # Fx7 - Sets VX to the value of the delay timer
+    def cpuFx7(self, m, opcode):
+        self.v[m, (opcode & 0xF00) >> 8] = self.delay_timer[m]
+        self.program_counter[m] += 2
+
+    # FxA - A key press is awaited and stored in VX. As with Chip8, this is
+    # the highest of keys 0 to E that is pressed.
+    def cpuFxA(self, m, opcode):
+        pressed = self.key[m, 0:0xF] == 1
+        waiting = ~pressed.any(axis=1)
+        m, opcode, pressed = m[~waiting], opcode[~waiting], pressed[~waiting]
+        self.v[m, (opcode & 0xF00) >> 8] = 0xE - np.argmax(pressed[:, ::-1], axis=1)
+        self.program_counter[m] += 2
+
+    # FX15 - Sets the delay timer to VX
+    def cpuFx15(self, m, opcode):
+        self.delay_timer[m] = self.v[m, (opcode & 0xF00) >> 8]
+        self.program_counter[m] += 2
+
+    # FX18 - Sets the sound timer to VX
+    def cpuFx18(self, m, opcode):
+        self.sound_timer[m] = self.v[m, (opcode & 0xF00) >> 8]
+        self.program_counter[m] += 2
+
+    # FX1E - Adds VX to I
+    def cpuFx1E(self, m, opcode):
+        x = (opcode & 0xF00) >> 8
+        self.v[m, 0xF] = self.i[m] + self.v[m, x] > 0xFFF
+        self.i[m] = (self.i[m] + self.v[m, x]) & 0xFFF
+        self.program_counter[m] += 2
+
+    # FX29 - Sets I to the location of the sprite for the character in VX
+    def cpuFx2x(self, m, opcode):
+        self.i[m] = self.v[m, (opcode & 0xF00) >> 8].astype(np.int32) * 0x5
+        self.program_counter[m] += 2
+
+    # FX33 - Stores the BCD representation of VX at I, I+1 and I+2
+    def cpuFx3x(self, m, opcode):
+        value = self.v[m, (opcode & 0xF00) >> 8]
+        self.memory[m, self.i[m]] = value // 100
+        self.memory[m, self.i[m] + 1] = (value // 10) % 10
+        self.memory[m, self.i[m] + 2] = value % 10
+        self.program_counter[m] += 2
+
+    # FX55 - Stores V0 to VX in memory starting at address I. I moves on by
+    # the last 4 bits of the opcode plus one, as it does in Chip8.
+    def cpuFx5x(self, m, opcode):
+        x = (opcode & 0xF00) >> 8
+        for counter in range(0, 16):
+            stored = counter <= x
+            self.memory[m[stored], self.i[m[stored]] + counter] = self.v[m[stored], counter]
+        self.i[m] += (opcode & 0xF) + 1
+        self.program_counter[m] += 2
+
+    # FX65 - Fills V0 to VX with values from memory starting at address I
+    def cpuFx6x(self, m, opcode):
+        x = (opcode & 0xF00) >> 8
+        for counter in range(0, 16):
+            loaded = counter <= x
+            self.v[m[loaded], counter] = self.memory[m[loaded], self.i[m[loaded]] + counter]
+        self.i[m] += (opcode & 0xF) + 1
+        self.program_counter[m] += 2
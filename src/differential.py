@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+import argparse
+import bisect
+import hashlib
+import struct
+import sys
+
+# Runs the same game on two machines in lock-step, each through a different
+# way of executing instructions, and checks that they stay the same. Any
+# change to how instructions are run can be checked against the plain
+# interpreter this way, over whole games rather than one opcode at a time.
+#
+# Each way of running is given a machine and runs one frame of it, so the
+# cached interpreter and the block compiler are run through run_frame, just
+# as headless.py and replay() run them. Between frames any key changes from
+# a movie are made, and every machine skips the frames it spends waiting on
+# the delay timer with fast_forward, but never past the next key change. The
+# registers, memory and screen of the two are compared every check_every
+# frames. When they differ, both are put back to the last point they matched
+# and run forward again to find the first frame after which they differ.
+
+# The plain interpreter, decoding every instruction as it is fetched, with
+# the same frame as run_frame
+def run_uncached(my_chip8):
+    my_chip8.waiting = None
+    counter = 0
+    while counter < my_chip8.cycles_per_frame and not my_chip8.waiting:
+        opcode, handler, x, y, n, nn, nnn = my_chip8.decode(my_chip8.fetch_opcode())
+        handler(x, y, n, nn, nnn)
+        counter += 1
+    my_chip8.count_down_timers()
+    my_chip8.frame_count += 1
+    return counter
+
+def run_cached(my_chip8):
+    return my_chip8.run_frame()
+
+def run_blocks(my_chip8):
+    return my_chip8.run_frame(blocks=True)
+
+backends = {
+    'uncached': run_uncached,
+    'cached': run_cached,
+    'blocks': run_blocks,
+}
+
+registers_format = struct.Struct('<HHBBBI')
+
+# The parts of a machine that are compared
+def parts(my_chip8):
+    registers = registers_format.pack(my_chip8.program_counter, my_chip8.i, my_chip8.stack_pointer,
+                                      my_chip8.delay_timer, my_chip8.sound_timer, my_chip8.frame_count)
+    return {
+        'registers': registers + bytes(my_chip8.v) + my_chip8.stack.tobytes(),
+        'memory': bytes(my_chip8.memory),
+        'graphics': bytes(my_chip8.graphics),
+    }
+
+def digests(my_chip8):
+    return {name: hashlib.blake2b(data, digest_size=8).digest() for (name, data) in parts(my_chip8).items()}
+
+class Differential:
+    def __init__(self, machines, runs, events=(), check_every=100, fast_forward=True):
+        self.machines = machines
+        self.runs = [backends.get(run, run) for run in runs]
+        self.check_every = check_every
+        self.fast_forward = fast_forward
+        self.events = {}
+        for (frame, key, state) in events:
+            self.events.setdefault(frame, []).append((key, state))
+        self.event_frames = sorted(self.events)
+        self.errors = [None] * len(machines)
+        self.instructions = [0] * len(machines)
+        self.frame = 0
+
+    # Run both machines for a number of frames. Returns None if they still
+    # match at the end, or a description of where they first differ.
+    def run(self, frames):
+        while self.frame < frames and not any(self.errors):
+            saved = self.save()
+            start = self.frame
+            self.advance(min(frames, start + self.check_every))
+            if not self.matching():
+                return self.bisect(saved, start, self.frame)
+        return None
+
+    def save(self):
+        states = [(my_chip8.save_state(), my_chip8.frame_count) for my_chip8 in self.machines]
+        return states, self.frame, list(self.instructions)
+
+    def restore(self, saved):
+        states, self.frame, instructions = saved
+        for (my_chip8, (state, frame_count)) in zip(self.machines, states):
+            my_chip8.load_state(state)
+            my_chip8.frame_count = frame_count
+        self.instructions = list(instructions)
+        self.errors = [None] * len(self.machines)
+
+    # Run both machines up to a frame
+    def advance(self, stop):
+        while self.frame < stop and not any(self.errors):
+            for (key, state) in self.events.get(self.frame, ()):
+                for my_chip8 in self.machines:
+                    my_chip8.key[key] = state
+            for (index, (my_chip8, run)) in enumerate(zip(self.machines, self.runs)):
+                try:
+                    self.instructions[index] += run(my_chip8)
+                except Exception as error:
+                    self.errors[index] = repr(error)
+            self.frame += 1
+            if self.fast_forward and not any(self.errors):
+                limit = stop - self.frame
+                following = bisect.bisect_left(self.event_frames, self.frame)
+                if following < len(self.event_frames):
+                    limit = min(limit, self.event_frames[following] - self.frame)
+                skipped = [my_chip8.fast_forward(limit) for my_chip8 in self.machines]
+                self.frame += skipped[0]
+
+    def matching(self):
+        first, second = self.machines
+        return self.errors[0] == self.errors[1] and digests(first) == digests(second)
+
+    # Find the first frame between two frames after which the machines
+    # differ, by running forward from where they last matched
+    def bisect(self, saved, start, stop):
+        low, high = start, stop
+        while high - low > 1:
+            middle = (low + high) // 2
+            self.restore(saved)
+            self.advance(middle)
+            if self.matching():
+                low = middle
+            else:
+                high = middle
+
+        self.restore(saved)
+        self.advance(low)
+        program_counter = self.machines[0].program_counter
+        instructions = list(self.instructions)
+        self.advance(high)
+        return {
+            'frame': low,
+            'program_counter': program_counter,
+            'instructions': [after - before for (before, after) in zip(instructions, self.instructions)],
+            'differences': self.differences(),
+            'errors': list(self.errors),
+        }
+
+    # Which parts differ, and where
+    def differences(self):
+        first, second = [parts(my_chip8) for my_chip8 in self.machines]
+        differences = {}
+        for name in first:
+            if first[name] != second[name]:
+                differences[name] = [offset for offset in range(0, len(first[name]))
+                                     if first[name][offset] != second[name][offset]]
+        return differences
+
+def main():
+    # Imported here, so the harness itself works with the tests' imports
+    from chip8 import Chip8
+    from movie import Movie
+
+    parser = argparse.ArgumentParser(description='Run a game two ways at once, and find where they first differ')
+    parser.add_argument('game', help='Path to the game to run')
+    parser.add_argument('--backends', nargs=2, default=['uncached', 'blocks'], choices=sorted(backends),
+                        help='The two ways to run instructions')
+    parser.add_argument('--frames', type=int, default=100000, help='Number of frames to run')
+    parser.add_argument('--check-every', type=int, default=100, help='Frames between comparisons')
+    parser.add_argument('--cycles-per-frame', type=int, default=Chip8.cycles_per_frame, help='Instructions run in each frame')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the random numbers')
+    parser.add_argument('--replay', help='Play the key presses in this movie into both machines')
+    args = parser.parse_args()
+
+    events = ()
+    seed = args.seed
+    cycles_per_frame = args.cycles_per_frame
+    if args.replay:
+        movie = Movie.load(args.replay)
+        events = movie.events
+        seed = movie.seed
+        cycles_per_frame = movie.cycles_per_frame
+
+    machines = []
+    for backend in args.backends:
+        my_chip8 = Chip8(seed)
+        my_chip8.initialise()
+        my_chip8.cycles_per_frame = cycles_per_frame
+        my_chip8.load_game(args.game)
+        machines.append(my_chip8)
+
+    differential = Differential(machines, args.backends, events, args.check_every)
+    divergence = differential.run(args.frames)
+    if divergence is None:
+        print("%s and %s match after %d frames, %d instructions" % (
+            args.backends[0], args.backends[1], differential.frame, differential.instructions[0]))
+        if any(differential.errors):
+            print("Both stopped with %s" % differential.errors[0])
+        return
+
+    print("%s and %s differ after frame %d, which started at %03x and ran %d and %d instructions" % (
+        args.backends[0], args.backends[1], divergence['frame'], divergence['program_counter'],
+        divergence['instructions'][0], divergence['instructions'][1]))
+    for (name, offsets) in divergence['differences'].items():
+        print("  %s differs at %s" % (name, ' '.join('%x' % offset for offset in offsets[0:16])))
+    for (backend, error) in zip(args.backends, divergence['errors']):
+        if error:
+            print("  %s stopped with %s" % (backend, error))
+    sys.exit(1)
+
+if __name__ == '__main__':
+    main()
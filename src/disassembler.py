@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import os
+
+# Static analysis of a game loaded into a machine: a listing of mnemonics,
+# and a control flow graph of the basic blocks reachable from 0x200, the
+# subroutines they call, and the jump targets between them.
+#
+# Instructions are decoded by the machine's own decode(), so the analysis
+# sees exactly the handlers the interpreter would run. Jumps through BNNN
+# and code written at run time can't be followed statically, so the graph
+# only holds what can be reached through plain jumps, calls and skips.
+
+# Mnemonics by handler, filled in from the decoded fields
+mnemonics = {
+    'cpuNULL': 'DW {opcode:04X}',
+    'cpu00E0': 'CLS',
+    'cpu00EE': 'RET',
+    'cpu1xxx': 'JP {nnn:03X}',
+    'cpu2xxx': 'CALL {nnn:03X}',
+    'cpu3xxx': 'SE V{x:X}, {nn:02X}',
+    'cpu4xxx': 'SNE V{x:X}, {nn:02X}',
+    'cpu5xxx': 'SE V{x:X}, V{y:X}',
+    'cpu6xxx': 'LD V{x:X}, {nn:02X}',
+    'cpu7xxx': 'ADD V{x:X}, {nn:02X}',
+    'cpu8xx': 'LD V{x:X}, V{y:X}',
+    'cpu8xx1': 'OR V{x:X}, V{y:X}',
+    'cpu8xx2': 'AND V{x:X}, V{y:X}',
+    'cpu8xx3': 'XOR V{x:X}, V{y:X}',
+    'cpu8xx4': 'ADD V{x:X}, V{y:X}',
+    'cpu8xx5': 'SUB V{x:X}, V{y:X}',
+    'cpu8xx6': 'SHR V{x:X}',
+    'cpu8xx7': 'SUBN V{x:X}, V{y:X}',
+    'cpu8xxE': 'SHL V{x:X}',
+    'cpu9xxx': 'SNE V{x:X}, V{y:X}',
+    'cpuAxxx': 'LD I, {nnn:03X}',
+    # A jump on other machines, but this one has always set I
+    'cpuBxxx': 'LD I, V0 + {nnn:03X}',
+    'cpuCxxx': 'RND V{x:X}, {nn:02X}',
+    'cpuDxxx': 'DRW V{x:X}, V{y:X}, {n:X}',
+    'cpuEx9x': 'SKP V{x:X}',
+    'cpuExAx': 'SKNP V{x:X}',
+    'cpuFx7': 'LD V{x:X}, DT',
+    'cpuFxA': 'LD V{x:X}, K',
+    'cpuFx15': 'LD DT, V{x:X}',
+    'cpuFx18': 'LD ST, V{x:X}',
+    'cpuFx1E': 'ADD I, V{x:X}',
+    'cpuFx2x': 'LD F, V{x:X}',
+    'cpuFx3x': 'LD B, V{x:X}',
+    'cpuFx5x': 'LD [I], V{x:X}',
+    'cpuFx6x': 'LD V{x:X}, [I]',
+}
+
+skips = {'cpu3xxx', 'cpu4xxx', 'cpu5xxx', 'cpu9xxx', 'cpuEx9x', 'cpuExAx'}
+
+# Bump this whenever the analysis changes, so old cached results are ignored
+analysis_version = 1
+default_cache = os.path.join(os.path.expanduser('~'), '.cache', 'chip8')
+
+def mnemonic(decoded):
+    opcode, handler, x, y, n, nn, nnn = decoded
+    return mnemonics[handler.__name__].format(opcode=opcode, x=x, y=y, n=n, nn=nn, nnn=nnn)
+
+# Every two bytes of the game as an instruction, as (address, opcode,
+# mnemonic), whether or not they are ever run
+def disassemble(my_chip8, size):
+    listing = []
+    for address in range(0x200, 0x200 + size - 1, 2):
+        decoded = my_chip8.decode(my_chip8.read_opcode(address))
+        listing.append((address, decoded[0], mnemonic(decoded)))
+    return listing
+
+# Where control can go after the instruction at an address, and whether it
+# ends a basic block. Calls end their block, with the instruction after them
+# as the only successor, and the subroutine recorded separately.
+def successors(address, decoded):
+    name = decoded[1].__name__
+    if name == 'cpu1xxx':
+        return [decoded[6]], True
+    if name == 'cpu2xxx':
+        return [address + 2], True
+    if name == 'cpu00EE':
+        return [], True
+    if name in skips:
+        return [address + 2, address + 4], True
+    return [address + 2], False
+
+# Build the control flow graph of the game loaded in a machine
+def analyse(my_chip8, size, entry=0x200):
+    instructions = {}
+    targets = {entry}
+    calls = set()
+    work = [entry]
+    while work:
+        address = work.pop()
+        if address in instructions or address + 1 >= len(my_chip8.memory):
+            continue
+        decoded = my_chip8.decode(my_chip8.read_opcode(address))
+        following, ends = successors(address, decoded)
+        instructions[address] = (decoded, following, ends)
+        if decoded[1].__name__ == 'cpu2xxx':
+            calls.add(decoded[6])
+            following = following + [decoded[6]]
+        if ends:
+            targets.update(following)
+        work.extend(following)
+
+    # A block runs from a target, or the instruction after the end of a
+    # block, up to and including the next instruction that ends one
+    blocks = []
+    for start in sorted(targets & set(instructions)):
+        address = start
+        while True:
+            decoded, following, ends = instructions[address]
+            if ends or address + 2 in targets or address + 2 not in instructions:
+                break
+            address += 2
+        blocks.append({
+            'start': start,
+            'end': address + 2,
+            'successors': sorted(following),
+            'calls': [decoded[6]] if decoded[1].__name__ == 'cpu2xxx' else [],
+        })
+
+    # The blocks of each subroutine are those reachable from its entry
+    # without following calls
+    by_start = {block['start']: block for block in blocks}
+    subroutines = {}
+    for call in sorted(calls & set(by_start)):
+        reached = set()
+        work = [call]
+        while work:
+            start = work.pop()
+            if start in reached or start not in by_start:
+                continue
+            reached.add(start)
+            work.extend(by_start[start]['successors'])
+        subroutines[call] = sorted(reached)
+
+    return {
+        'version': analysis_version,
+        'entry': entry,
+        # Lists rather than tuples, so a result is the same read back from JSON
+        'instructions': sorted([address, decoded[0], mnemonic(decoded)]
+                               for (address, (decoded, following, ends)) in instructions.items()),
+        'blocks': blocks,
+        'subroutines': [{'entry': call, 'blocks': reached} for (call, reached) in subroutines.items()],
+        'jump_targets': sorted(targets & set(instructions)),
+        'size': size,
+    }
+
+# The analysis of the game loaded in a machine, from the cache if it has
+# been done before, keyed by the game's SHA-1
+def load_analysis(my_chip8, size, cache_dir=default_cache):
+    game_hash = hashlib.sha1(my_chip8.memory[0x200:0x200 + size]).hexdigest()
+    path = os.path.join(cache_dir, '%s-%d.json' % (game_hash, analysis_version))
+    try:
+        with open(path) as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        pass
+    analysis = analyse(my_chip8, size)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Written under another name first, so a reader never sees half a file
+    with open(path + '.tmp', 'w') as cache_file:
+        json.dump(analysis, cache_file)
+    os.replace(path + '.tmp', path)
+    return analysis
+
+# The control flow graph in Graphviz's dot language
+def dot(analysis):
+    lines = ['digraph chip8 {', '    node [shape=box fontname=monospace]']
+    listing = {address: (opcode, text) for (address, opcode, text) in analysis['instructions']}
+    # Only edges to the start of a block, as anything else would be drawn as
+    # a node of its own with no label
+    starts = set(block['start'] for block in analysis['blocks'])
+    for block in analysis['blocks']:
+        label = '\\l'.join('%03x  %s' % (address, listing[address][1])
+                           for address in range(block['start'], block['end'], 2))
+        lines.append('    b%03x [label="%s\\l"]' % (block['start'], label))
+        for successor in block['successors']:
+            if successor in starts:
+                lines.append('    b%03x -> b%03x' % (block['start'], successor))
+        for call in block['calls']:
+            if call in starts:
+                lines.append('    b%03x -> b%03x [style=dashed]' % (block['start'], call))
+    lines.append('}')
+    return '\n'.join(lines)
+
+def main():
+    # Imported here, so the analysis itself works with the tests' imports
+    from chip8 import Chip8
+
+    parser = argparse.ArgumentParser(description='Disassemble a Chip8 game')
+    parser.add_argument('game', help='Path to the game')
+    parser.add_argument('--all', action='store_true', help='List every two bytes, not just the code reachable from 0x200')
+    parser.add_argument('--dot', action='store_true', help='Print the control flow graph for Graphviz instead')
+    parser.add_argument('--cache', default=default_cache, help='Directory to cache the analysis in')
+    args = parser.parse_args()
+
+    my_chip8 = Chip8(0)
+    my_chip8.initialise()
+    size = my_chip8.load_game(args.game)
+    if args.all:
+        for (address, opcode, text) in disassemble(my_chip8, size):
+            print("%03x  %04x  %s" % (address, opcode, text))
+        return
+
+    analysis = load_analysis(my_chip8, size, args.cache)
+    if args.dot:
+        print(dot(analysis))
+        return
+    subroutines = set(subroutine['entry'] for subroutine in analysis['subroutines'])
+    targets = set(analysis['jump_targets'])
+    for (address, opcode, text) in analysis['instructions']:
+        if address in subroutines:
+            print("\nsub_%03x:" % address)
+        elif address in targets:
+            print("loc_%03x:" % address)
+        print("    %03x  %04x  %s" % (address, opcode, text))
+
+if __name__ == '__main__':
+    main()
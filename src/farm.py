@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import sys
+import time
+
+# Run a set of games headless across a pool of processes, writing one line of
+# JSON per game to the results file as each one finishes. Games already in the
+# results file without an error are skipped, so an interrupted run can be
+# started again where it left off.
+#
+# Games come from a directory of .ch8 files, or a manifest listing one path
+# per line. A game can have a movie of key presses next to it with the same
+# name and a .c8m extension, as recorded by main.py --record. Or an input
+# script with a .keys extension, with lines of "frame key state", e.g.
+# "120 5 1" presses key 5 at the start of frame 120.
+def main():
+    # Imported here, so the rest of the farm works with the tests' imports
+    from chip8 import Chip8
+
+    parser = argparse.ArgumentParser(description='Run many Chip8 games in parallel without a display')
+    parser.add_argument('games', help='Directory of .ch8 games, or a manifest listing one per line')
+    parser.add_argument('--results', default='results.jsonl', help='File to write the results to')
+    parser.add_argument('--frames', type=int, default=600, help='Number of 60Hz frames to run each game for')
+    parser.add_argument('--cycles-per-frame', type=int, default=Chip8.cycles_per_frame, help='Instructions run in each frame')
+    parser.add_argument('--blocks', action='store_true', help='Run with the block compiler instead of the interpreter')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the random numbers in every game without a movie')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of processes to run')
+    args = parser.parse_args()
+
+    finished = load_finished(args.results)
+    jobs = [(game, args.frames, args.cycles_per_frame, args.blocks, args.seed)
+            for game in find_games(args.games) if game not in finished]
+    print("Running %d games, %d already done" % (len(jobs), len(finished)), file=sys.stderr)
+
+    with open(args.results, 'a') as results, \
+            concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(run_game, *job): job[0] for job in jobs}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as error:
+                # The worker running this game died, rather than the game
+                # failing inside it
+                result = {'game': futures[future], 'error': repr(error)}
+            results.write(json.dumps(result) + '\n')
+            results.flush()
+
+def find_games(games):
+    if os.path.isdir(games):
+        return sorted(os.path.join(games, name) for name in os.listdir(games) if name.endswith('.ch8'))
+    directory = os.path.dirname(games)
+    with open(games) as manifest:
+        return [os.path.join(directory, line.strip()) for line in manifest
+                if line.strip() and not line.startswith('#')]
+
+def load_finished(results):
+    finished = set()
+    if os.path.exists(results):
+        with open(results) as results_file:
+            for line in results_file:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    # A line cut short when the last run was stopped
+                    continue
+                if 'error' not in result:
+                    finished.add(result['game'])
+    return finished
+
+def load_movie(game, cycles_per_frame, seed):
+    from movie import Movie
+
+    recorded = os.path.splitext(game)[0] + '.c8m'
+    if os.path.exists(recorded):
+        return Movie.load(recorded)
+    script = os.path.splitext(game)[0] + '.keys'
+    events = []
+    if os.path.exists(script):
+        with open(script) as script_file:
+            for line in script_file:
+                if line.strip() and not line.startswith('#'):
+                    frame, key, state = (int(value, 0) for value in line.split())
+                    events.append((frame, key, state))
+    return Movie(None, seed, cycles_per_frame, sorted(events))
+
+# Run one game for a number of frames, feeding in its input script, and
+# return a summary of where it ended up
+def run_game(game, frames, cycles_per_frame=10, blocks=False, seed=0):
+    from chip8 import Chip8
+    from movie import replay
+
+    result = {'game': game}
+    my_chip8 = Chip8()
+    my_chip8.initialise()
+    movie = load_movie(game, cycles_per_frame, seed)
+
+    start = time.perf_counter()
+    counter = 0
+    try:
+        my_chip8.load_game(game)
+        counter = replay(my_chip8, movie, frames, blocks)
+    except Exception as error:
+        result['error'] = repr(error)
+    elapsed = time.perf_counter() - start
+
+    result.update({
+        'frames': my_chip8.frame_count,
+        'instructions': counter,
+        'seconds': elapsed,
+        'screen': hashlib.sha1(my_chip8.graphics).hexdigest(),
+        'v': bytes(my_chip8.v).hex(),
+        'i': my_chip8.i,
+        'program_counter': my_chip8.program_counter,
+        'events': my_chip8.event_counts,
+    })
+    return result
+
+if __name__ == '__main__':
+    main()
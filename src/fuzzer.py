@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+import argparse
+import concurrent.futures
+import hashlib
+import logging
+import os
+import random
+import sys
+import time
+
+# Coverage guided fuzzing of the emulator. Games and key presses are
+# mutated, run headless for a fixed number of frames, and kept in a corpus
+# whenever they reach anything no earlier run did.
+#
+# Coverage is the set of handlers run, each with where it went next: on to
+# the next instruction, skipping one, staying put, or jumping forwards or
+# backwards. Each of those is also bucketed by how many times it happened,
+# in powers of two, so that going round a loop more times counts as new. A
+# run that raises anything, including SystemExit, is a crash, kept once for
+# each exception and handler it happened in.
+#
+# Every run starts by loading the same saved state of a freshly reset
+# machine and copying the game over it, which is the cheapest way there is to
+# get back to a clean machine.
+
+max_mutations = 4
+
+# Run a game with key presses, given as (frame, key, state), from a saved
+# state for a number of frames. Returns the coverage, and the crash if any as
+# the exception and handler it happened in, then the address and opcode.
+def run_input(my_chip8, base_state, game, events, frames):
+    my_chip8.load_state(base_state)
+    my_chip8.memory[0x200:0x200 + len(game)] = game
+    my_chip8.frame_count = 0
+    my_chip8.event_counts = {}
+    presses = {}
+    for (frame, key, state) in events:
+        presses.setdefault(frame, []).append((key, state))
+
+    edges = {}
+    crash = None
+    execute_opcode = my_chip8.execute_opcode
+    count_down_timers = my_chip8.count_down_timers
+    cycles_per_frame = range(0, my_chip8.cycles_per_frame)
+    address = my_chip8.program_counter
+    try:
+        for frame in range(0, frames):
+            for (key, state) in presses.get(frame, ()):
+                my_chip8.key[key] = state
+            for counter in cycles_per_frame:
+                address = my_chip8.program_counter
+                execute_opcode()
+                edge = address << 16 | my_chip8.program_counter
+                edges[edge] = edges.get(edge, 0) + 1
+            count_down_timers()
+    except (Exception, SystemExit) as error:
+        decoded = my_chip8.decode_cache[address] if address < len(my_chip8.decode_cache) else None
+        handler = decoded[1].__name__ if decoded else 'fetch'
+        crash = (type(error).__name__, handler, address, my_chip8.opcode)
+    return features(my_chip8, edges), crash
+
+# Turn the counts of each (address, next address) taken into coverage
+def features(my_chip8, edges):
+    decode_cache = my_chip8.decode_cache
+    counts = {}
+    for (edge, count) in edges.items():
+        address = edge >> 16
+        decoded = decode_cache[address]
+        if decoded is None:
+            # Written over after it ran
+            continue
+        step = (edge & 0xFFFF) - address
+        if step == 2:
+            outcome = 'next'
+        elif step == 4:
+            outcome = 'skip'
+        elif step == 0:
+            outcome = 'stay'
+        else:
+            outcome = 'forward' if step > 0 else 'back'
+        feature = (decoded[1].__name__, outcome)
+        counts[feature] = counts.get(feature, 0) + count
+    return set(feature + (count.bit_length(),) for (feature, count) in counts.items())
+
+def random_opcode(rng):
+    return bytes([rng.randrange(0, 256), rng.randrange(0, 256)])
+
+# A copy of a corpus entry with a few random changes to the game, the key
+# presses, or both
+def mutate(rng, entry, corpus, frames, max_game_size=3584):
+    game, events = bytearray(entry[0]), list(entry[1])
+    for mutation in range(0, rng.randint(1, max_mutations)):
+        choice = rng.randrange(0, 9)
+        offset = rng.randrange(0, len(game)) & ~1 if game else 0
+        if choice == 0 and game:
+            game[offset] ^= 1 << rng.randrange(0, 8)
+        elif choice == 1 and game:
+            game[rng.randrange(0, len(game))] = rng.randrange(0, 256)
+        elif choice == 2:
+            game[offset:offset + 2] = random_opcode(rng)
+        elif choice == 3 and len(game) < max_game_size - 2:
+            game[offset:offset] = random_opcode(rng)
+        elif choice == 4 and len(game) > 2:
+            del game[offset:offset + 2]
+        elif choice == 5:
+            # Splice in a piece of another game
+            other = rng.choice(corpus)[0]
+            if other:
+                start = rng.randrange(0, len(other)) & ~1
+                game[offset:offset + 2 * rng.randint(1, 8)] = other[start:start + 2 * rng.randint(1, 8)]
+        elif choice == 6:
+            # Press a key, and let it go a little later
+            frame = rng.randrange(0, frames)
+            key = rng.randrange(0, 16)
+            events += [(frame, key, 1), (min(frame + rng.randint(1, 10), frames - 1), key, 0)]
+        elif choice == 7 and events:
+            del events[rng.randrange(0, len(events))]
+        elif choice == 8 and events:
+            index = rng.randrange(0, len(events))
+            frame, key, state = events[index]
+            events[index] = (rng.randrange(0, frames), key, state)
+    if not game:
+        game = bytearray(random_opcode(rng))
+    return bytes(game[0:max_game_size]), tuple(sorted(events))
+
+# Fuzz for a number of runs, adding entries that reach new coverage to the
+# corpus and coverage given. Returns the new entries, the first crash found
+# for each exception and handler as {crash: entry}, and the number of runs.
+def fuzz(my_chip8, base_state, corpus, coverage, rng, iterations, frames):
+    found = []
+    crashes = {}
+    seen = set()
+    for iteration in range(0, iterations):
+        entry = mutate(rng, rng.choice(corpus), corpus, frames)
+        run_coverage, crash = run_input(my_chip8, base_state, entry[0], entry[1], frames)
+        if crash is not None and crash[0:2] not in seen:
+            seen.add(crash[0:2])
+            crashes[crash] = entry
+        new = run_coverage - coverage
+        if new:
+            coverage |= new
+            corpus.append(entry)
+            found.append(entry)
+    return found, crashes, iterations
+
+# Each process keeps one machine, and the state of it freshly reset
+worker_chip8 = None
+worker_state = None
+
+def worker_machine(cycles_per_frame):
+    global worker_chip8, worker_state
+    if worker_chip8 is None:
+        # Imported here, so the rest of the module works with the tests' imports
+        from chip8 import Chip8
+        logging.getLogger('chip8').setLevel(logging.ERROR)
+        worker_chip8 = Chip8(0)
+        worker_chip8.initialise()
+    if worker_chip8.cycles_per_frame != cycles_per_frame or worker_state is None:
+        worker_chip8.cycles_per_frame = cycles_per_frame
+        worker_chip8.reset(0)
+        worker_state = worker_chip8.save_state()
+    return worker_chip8, worker_state
+
+def fuzz_worker(corpus, coverage, seed, iterations, frames, cycles_per_frame):
+    my_chip8, base_state = worker_machine(cycles_per_frame)
+    start = time.perf_counter()
+    found, crashes, runs = fuzz(my_chip8, base_state, list(corpus), set(coverage),
+                                random.Random(seed), iterations, frames)
+    return found, crashes, runs, time.perf_counter() - start
+
+def load_seeds(paths):
+    corpus = []
+    for path in paths:
+        names = [path]
+        if os.path.isdir(path):
+            names = sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.ch8'))
+        for name in names:
+            with open(name, 'rb') as game_file:
+                game = game_file.read()
+            corpus.append((game, load_keys(os.path.splitext(name)[0] + '.keys')))
+    return corpus
+
+# Key presses in the same "frame key state" lines as farm.py reads
+def load_keys(path):
+    events = []
+    if os.path.exists(path):
+        with open(path) as keys_file:
+            for line in keys_file:
+                if line.strip() and not line.startswith('#'):
+                    events.append(tuple(int(value, 0) for value in line.split()))
+    return tuple(sorted(events))
+
+def save_entry(directory, name, entry):
+    game, events = entry
+    with open(os.path.join(directory, name + '.ch8'), 'wb') as game_file:
+        game_file.write(game)
+    if events:
+        with open(os.path.join(directory, name + '.keys'), 'w') as keys_file:
+            keys_file.write(''.join('%d %d %d\n' % event for event in events))
+
+def main():
+    parser = argparse.ArgumentParser(description='Fuzz the emulator with mutated games and key presses')
+    parser.add_argument('seeds', nargs='*', help='Games, or directories of games, to start from')
+    parser.add_argument('--corpus', default='corpus', help='Directory to keep the inputs that reach new coverage in')
+    parser.add_argument('--crashes', default='crashes', help='Directory to keep the inputs that crash in')
+    parser.add_argument('--frames', type=int, default=60, help='Number of frames to run each input for')
+    parser.add_argument('--cycles-per-frame', type=int, default=10, help='Instructions run in each frame')
+    parser.add_argument('--iterations', type=int, default=2000, help='Runs each worker does in a round')
+    parser.add_argument('--rounds', type=int, help='Number of rounds to run, forever by default')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of processes to run')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the mutations')
+    args = parser.parse_args()
+
+    os.makedirs(args.corpus, exist_ok=True)
+    os.makedirs(args.crashes, exist_ok=True)
+    corpus = load_seeds(args.seeds + [args.corpus]) or [(bytes([0x12, 0x00]), ())]
+    coverage = set()
+    crashes = set(tuple(name.split('-')[0:2]) for name in os.listdir(args.crashes) if name.endswith('.ch8'))
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=args.workers)
+    round_number = 0
+    try:
+        while args.rounds is None or round_number < args.rounds:
+            futures = [pool.submit(fuzz_worker, corpus, coverage, '%d %d %d' % (args.seed, round_number, worker),
+                                   args.iterations, args.frames, args.cycles_per_frame)
+                       for worker in range(0, args.workers)]
+            runs = 0
+            broken = False
+            start = time.perf_counter()
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    found, found_crashes, worker_runs, seconds = future.result()
+                except concurrent.futures.process.BrokenProcessPool:
+                    broken = True
+                    continue
+                runs += worker_runs
+                merge(found, corpus, coverage, args)
+                for ((exception, handler, address, opcode), entry) in found_crashes.items():
+                    if (exception, handler) not in crashes:
+                        crashes.add((exception, handler))
+                        save_entry(args.crashes, '%s-%s-%03x-%04x' % (exception, handler, address, opcode), entry)
+            if broken:
+                # A worker died outright, taking the pool with it
+                pool.shutdown(cancel_futures=True)
+                pool = concurrent.futures.ProcessPoolExecutor(max_workers=args.workers)
+            elapsed = time.perf_counter() - start
+            print("Round %d: %d runs, %.0f a second, %d in corpus, %d covered, %d crashes" % (
+                round_number, runs, runs / elapsed if elapsed else 0, len(corpus), len(coverage), len(crashes)),
+                file=sys.stderr)
+            round_number += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+# Add the entries a worker found to the corpus, if they still reach anything
+# new once the other workers' finds are counted
+def merge(found, corpus, coverage, args):
+    my_chip8, base_state = worker_machine(args.cycles_per_frame)
+    for entry in found:
+        run_coverage, crash = run_input(my_chip8, base_state, entry[0], entry[1], args.frames)
+        new = run_coverage - coverage
+        if new:
+            coverage |= new
+            corpus.append(entry)
+            save_entry(args.corpus, hashlib.sha1(entry[0] + repr(entry[1]).encode()).hexdigest(), entry)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import logging
+import sys
+import time
+
+def main():
+    # Imported here, so run() and run_cycles() work with the tests' imports
+    from chip8 import Chip8
+    from disassembler import load_analysis
+    from movie import Movie, hash_game, replay
+    from profiler import Profiler
+    from tracer import Tracer
+
+    parser = argparse.ArgumentParser(description='Run a Chip8 game without a display')
+    parser.add_argument('game', help='Path to the game to run')
+    length = parser.add_mutually_exclusive_group()
+    length.add_argument('--cycles', type=int, help='Number of instructions to run')
+    length.add_argument('--frames', type=int, help='Number of 60Hz frames to run, 600 by default or the length of the movie')
+    parser.add_argument('--cycles-per-frame', type=int, default=Chip8.cycles_per_frame, help='Instructions run in each frame')
+    parser.add_argument('--blocks', action='store_true', help='Run with the block compiler instead of the interpreter')
+    parser.add_argument('--seed', type=int, help='Seed for the random numbers, instead of a random one')
+    parser.add_argument('--replay', help='Play back the key presses in a movie recorded with main.py --record')
+    parser.add_argument('--dump-screen', action='store_true', help='Print the screen when finished')
+    parser.add_argument('--dump-state', action='store_true', help='Print the registers when finished')
+    parser.add_argument('--profile', help='Count every instruction run, writing the counts to this JSON file and a summary to stderr')
+    parser.add_argument('--stream', type=int, metavar='PORT', help='Run in real time, serving the screen over TCP on this port')
+    parser.add_argument('--video', help='Run in real time, writing the screen to this file as a stream of PBM images')
+    parser.add_argument('--heatmap', help='Write how often each address was run to this PGM image')
+    parser.add_argument('--trace', help='Write a record of every instruction run to this file, to read with tracer.py')
+    parser.add_argument('--trace-last', type=int, metavar='N', help='Only trace the last N instructions, before the end or an error')
+    args = parser.parse_args()
+    if args.trace_last and not args.trace:
+        parser.error("--trace-last needs --trace, to save the trace to")
+    if args.cycles is not None and (args.replay or args.stream is not None or args.video):
+        parser.error("--cycles can't be used with --replay, --stream or --video, which run whole frames")
+
+    # Only warnings, such as unknown opcodes, so the output is left for results
+    logging.basicConfig(level=logging.WARNING, format='%(message)s')
+    my_chip8 = Chip8(args.seed)
+    my_chip8.initialise()
+    my_chip8.cycles_per_frame = args.cycles_per_frame
+    size = my_chip8.load_game(args.game)
+
+    my_profiler = None
+    if args.profile or args.heatmap:
+        # Analysed before running, while memory still holds just the game
+        analysis = load_analysis(my_chip8, size)
+        my_profiler = Profiler()
+        my_chip8.attach(my_profiler)
+
+    my_tracer = None
+    if args.trace:
+        if args.trace_last:
+            my_tracer = Tracer(ring=args.trace_last)
+        else:
+            my_tracer = Tracer(open(args.trace, 'wb'))
+        my_chip8.attach(my_tracer)
+
+    start = time.perf_counter()
+    try:
+        if args.stream is not None or args.video:
+            cycles = run_realtime(my_chip8, args.frames, args.stream, args.video)
+        elif args.replay:
+            movie = Movie.load(args.replay)
+            if movie.game_hash != hash_game(args.game):
+                print("Warning: %s was recorded with a different game" % args.replay, file=sys.stderr)
+            cycles = replay(my_chip8, movie, args.frames, args.blocks)
+        elif args.cycles is not None:
+            cycles = run_cycles(my_chip8, args.cycles, args.blocks)
+        else:
+            cycles = run(my_chip8, 600 if args.frames is None else args.frames, args.blocks)
+    finally:
+        # Keep the trace up to an error, which is when it is most wanted
+        if my_tracer and my_tracer.ring:
+            my_tracer.save(args.trace)
+        elif my_tracer:
+            my_tracer.flush()
+            my_tracer.trace_file.close()
+    elapsed = time.perf_counter() - start
+
+    if args.dump_screen:
+        dump_screen(my_chip8)
+    if args.dump_state:
+        dump_state(my_chip8)
+    if args.profile:
+        my_profiler.write_json(args.profile, analysis)
+        print(my_profiler.table(), file=sys.stderr)
+    if args.heatmap:
+        my_profiler.write_heatmap(args.heatmap)
+    print("%d instructions in %.3f seconds, %.0f instructions per second"
+          % (cycles, elapsed, cycles / elapsed if elapsed else 0), file=sys.stderr)
+    if my_chip8.event_counts:
+        print("Events: " + ', '.join('%s %d' % event for event in sorted(my_chip8.event_counts.items())), file=sys.stderr)
+
+# Run a number of frames as fast as possible, skipping over any the program
+# spends waiting on the delay timer, apart from the last. Returns the number
+# of instructions run.
+def run(my_chip8, frames, blocks=False):
+    counter = 0
+    frame = 0
+    while frame < frames:
+        counter += my_chip8.run_frame(blocks)
+        frame += 1
+        frame += my_chip8.fast_forward(frames - frame - 1)
+    return counter
+
+# Run exactly a number of instructions, counting down the timers after every
+# cycles_per_frame of them. Nothing is skipped, and waiting on a key doesn't
+# end a frame early, so the count is never more or less than asked for.
+# Returns the number of instructions run.
+def run_cycles(my_chip8, cycles, blocks=False):
+    blocks = blocks and not my_chip8.observers
+    cycles_per_frame = my_chip8.cycles_per_frame
+    counter = 0
+    while counter < cycles:
+        if blocks:
+            counter += my_chip8.run_block(min(cycles, counter + cycles_per_frame - counter % cycles_per_frame) - counter)
+        else:
+            my_chip8.execute_opcode()
+            counter += 1
+        if counter % cycles_per_frame == 0:
+            my_chip8.count_down_timers()
+            my_chip8.frame_count += 1
+    return counter
+
+# Run at the normal speed with the given front ends, for a number of frames
+# or until interrupted. Returns the number of instructions run.
+def run_realtime(my_chip8, frames, port, video):
+    from runtime import Runtime, ScreenRecorder, ScreenStreamer
+
+    frontends = []
+    if port is not None:
+        frontends.append(ScreenStreamer('0.0.0.0', port))
+    if video:
+        frontends.append(ScreenRecorder(video))
+    runtime = Runtime(my_chip8, frontends)
+    try:
+        asyncio.run(runtime.run(None if frames is None else frames / my_chip8.timer_hz))
+    except KeyboardInterrupt:
+        pass
+    return runtime.instructions
+
+def dump_screen(my_chip8):
+    for y in range(0, my_chip8.screen_height):
+        row = my_chip8.graphics[y * my_chip8.screen_width:(y + 1) * my_chip8.screen_width]
+        print(''.join('#' if pixel else '.' for pixel in row))
+
+def dump_state(my_chip8):
+    print("PC: %03x  I: %03x  SP: %x  DT: %02x  ST: %02x" % (
+        my_chip8.program_counter,
+        my_chip8.i,
+        my_chip8.stack_pointer,
+        my_chip8.delay_timer,
+        my_chip8.sound_timer,
+    ))
+    print("V:     " + ' '.join('%02x' % value for value in my_chip8.v))
+    print("Stack: " + ' '.join('%03x' % value for value in my_chip8.stack))
+
+if __name__ == '__main__':
+    main()
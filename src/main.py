@@ -1,16 +1,39 @@
 #!/usr/bin/env python3
-import sys
+import argparse
+import asyncio
+import concurrent.futures
+import logging
 
 import glfw
+import numpy as np
 from OpenGL.GL import (
     GL_COLOR_BUFFER_BIT,
     GL_QUADS,
+    GL_TEXTURE_2D,
+    GL_TEXTURE_MIN_FILTER,
+    GL_TEXTURE_MAG_FILTER,
+    GL_TEXTURE_SWIZZLE_RGBA,
+    GL_NEAREST,
+    GL_R8,
+    GL_RED,
+    GL_ONE,
+    GL_UNSIGNED_BYTE,
+    GL_UNPACK_ALIGNMENT,
     glClear,
     glClearColor,
     glBegin,
     glEnd,
     glColor3f,
-    glVertex3f,
+    glVertex2f,
+    glTexCoord2f,
+    glGenTextures,
+    glBindTexture,
+    glTexParameteri,
+    glTexParameteriv,
+    glTexImage2D,
+    glTexSubImage2D,
+    glPixelStorei,
+    glEnable,
     glViewport,
     glMatrixMode,
     GL_PROJECTION,
@@ -20,6 +43,9 @@ from OpenGL.GL import (
 )
 
 from chip8 import Chip8
+from movie import Recorder
+from rewind import Rewind
+from runtime import Frontend, Runtime, changed_runs
 
 window_name = 'Chip8 Emulator'
 screen_width = 64
@@ -27,9 +53,28 @@ screen_height = 32
 modifier = 10
 display_width = screen_width * modifier
 display_height = screen_height * modifier
-screen_data = [[[0]*3]*screen_width]*screen_height
+# Held down to step backwards through the recorded frames
+rewind_key = glfw.KEY_BACKSPACE
+rewinding = False
+# The left hand side of the keyboard, laid out like the Chip8 keypad
+keypad = {
+    glfw.KEY_1: 0x1, glfw.KEY_2: 0x2, glfw.KEY_3: 0x3, glfw.KEY_4: 0xC,
+    glfw.KEY_Q: 0x4, glfw.KEY_W: 0x5, glfw.KEY_E: 0x6, glfw.KEY_R: 0xD,
+    glfw.KEY_A: 0x7, glfw.KEY_S: 0x8, glfw.KEY_D: 0x9, glfw.KEY_F: 0xE,
+    glfw.KEY_Z: 0xA, glfw.KEY_X: 0x0, glfw.KEY_C: 0xB, glfw.KEY_V: 0xF,
+}
+# Passes key presses on to the machine, keeping a movie of them
+recorder = None
+screen_data = np.zeros((screen_height, screen_width), dtype=np.uint8)
 
 def main():
+    parser = argparse.ArgumentParser(description='Chip8 Emulator')
+    parser.add_argument('game', help='Path to the game to run')
+    parser.add_argument('--seed', type=int, help='Seed for the random numbers, instead of a random one')
+    parser.add_argument('--record', help='Save a movie of the key presses, to play back with headless.py --replay')
+    parser.add_argument('--cycles-per-frame', type=int, default=Chip8.cycles_per_frame, help='Instructions run in each 60Hz frame')
+    args = parser.parse_args()
+
     if not glfw.init():
         raise Exception("GLFW initialisation failed")
 
@@ -46,20 +91,38 @@ def main():
         raise Exception("GLFW window creation failed")
 
     glfw.make_context_current(window)
+    # Draw at the display's refresh rate
+    glfw.swap_interval(1)
     glClearColor(0.1, 0.2, 0.3, 1.0)
+    create_screen_texture()
+    # Drawing happens on its own thread from here on
+    glfw.make_context_current(None)
 
-    # global my_chip8
-    my_chip8 = Chip8()
+    global recorder
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    my_chip8 = Chip8(args.seed)
     my_chip8.initialise()
-    my_chip8.load_game(sys.argv[1])
-
-    while not glfw.window_should_close(window):
-        glfw.poll_events()
-        glClear(GL_COLOR_BUFFER_BIT)
-        display(my_chip8)
-        glfw.swap_buffers(window)
-
+    my_chip8.cycles_per_frame = args.cycles_per_frame
+    my_chip8.listen('beep', beep)
+    my_chip8.load_game(args.game)
+    rewind = Rewind(my_chip8)
+    recorder = Recorder(my_chip8, args.game)
+    glfw.set_key_callback(window, key_callback)
+
+    # Emulation runs in 60Hz frames, however fast the screen is drawn
+    def step():
+        if rewinding:
+            rewind.step_back()
+            recorder.rewind()
+        else:
+            my_chip8.run_frame()
+            rewind.record()
+
+    frontend = WindowFrontend(window)
+    asyncio.run(Runtime(my_chip8, [frontend], step).run())
     glfw.terminate()
+    if args.record:
+        recorder.save(args.record)
 
     # glutInit(sys.argv)
     # glutInitDisplayMode(GLUT_RGBA)
@@ -74,17 +137,42 @@ def main():
 
     # glutMainLoop()
 
-def update_screen(my_chip8):
-    for y in range(0, my_chip8.screen_height):
-        for x in range(0, my_chip8.screen_width):
-            if my_chip8.graphics[(y * my_chip8.screen_width) + x] == 1:
-                glColor3f(1.0,1.0,1.0)
-                glBegin(GL_QUADS)
-                glVertex3f((x * modifier) + 0.0, (y * modifier) + 0.0, 0.0)
-                glVertex3f((x * modifier) + 0.0, (y * modifier) + modifier, 0.0)
-                glVertex3f((x * modifier) + modifier, (y * modifier) + modifier, 0.0)
-                glVertex3f((x * modifier) + modifier, (y * modifier) + 0.0, 0.0)
-                glEnd()
+# The screen is kept in a single one channel texture, which is drawn as one
+# quad covering the window, rather than drawing a quad for every pixel.
+def create_screen_texture():
+    texture = glGenTextures(1)
+    glBindTexture(GL_TEXTURE_2D, texture)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+    # Only the red channel is stored, so show it as white
+    glTexParameteriv(GL_TEXTURE_2D, GL_TEXTURE_SWIZZLE_RGBA, [GL_RED, GL_RED, GL_RED, GL_ONE])
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+    glTexImage2D(GL_TEXTURE_2D, 0, GL_R8, screen_width, screen_height, 0, GL_RED, GL_UNSIGNED_BYTE, screen_data)
+    glEnable(GL_TEXTURE_2D)
+    return texture
+
+# Upload runs of rows of the screen, as given by changed_runs()
+def update_screen(runs):
+    for (start, stop, pixels) in runs:
+        rows = np.unpackbits(np.frombuffer(pixels, dtype=np.uint8)).reshape(stop - start, screen_width)
+        # Pixels are 0 or 1, so scale them up to the full range of the texture
+        np.multiply(rows, 255, out=screen_data[start:stop])
+        glTexSubImage2D(GL_TEXTURE_2D, 0, 0, start, screen_width, stop - start, GL_RED, GL_UNSIGNED_BYTE,
+                        screen_data[start:stop])
+
+def draw_screen():
+    # The first row of the texture is the top of the screen
+    glColor3f(1.0, 1.0, 1.0)
+    glBegin(GL_QUADS)
+    glTexCoord2f(0.0, 0.0)
+    glVertex2f(-1.0, 1.0)
+    glTexCoord2f(0.0, 1.0)
+    glVertex2f(-1.0, -1.0)
+    glTexCoord2f(1.0, 1.0)
+    glVertex2f(1.0, -1.0)
+    glTexCoord2f(1.0, 0.0)
+    glVertex2f(1.0, 1.0)
+    glEnd()
 
 def iterate():
     glViewport(0, 0, screen_width, screen_height)
@@ -94,15 +182,40 @@ def iterate():
     glMatrixMode(GL_MODELVIEW)
     glLoadIdentity()
 
-def display(my_chip8):
-    # start = time.clock() # get current time for timing purposes.
-    # emulate chip 8 cycle
-    my_chip8.emulate_cycle()
-    if my_chip8.draw_flag:
-        update_screen(my_chip8)
-        my_chip8.draw_flag = False
-    # if (1.0 / my_chip8.ops_per_second - (time.clock() - start)) > 0:
-    #     time.sleep(1.0 / my_chip8.ops_per_second - (time.clock() - start)) # We sleep a bit to keep timing right
+# Shows the screen in the window and reads the keyboard. Drawing and
+# swapping buffers wait on the display, so they happen on a thread of their
+# own with the GL context, while the rows to draw are copied out of the
+# machine between frames.
+class WindowFrontend(Frontend):
+    # Swapping buffers waits for the display, which paces the drawing
+    present_hz = None
+    poll_hz = 250
+
+    def __init__(self, window):
+        self.window = window
+        self.presented = 0
+        self.drawing = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.drawing.submit(glfw.make_context_current, window)
+
+    def poll(self, runtime):
+        glfw.poll_events()
+        if glfw.window_should_close(self.window):
+            runtime.stop()
+
+    async def present(self, my_chip8):
+        runs = changed_runs(my_chip8, self.presented)
+        self.presented = my_chip8.generation
+        await asyncio.get_running_loop().run_in_executor(self.drawing, self.draw, runs)
+
+    def draw(self, runs):
+        glClear(GL_COLOR_BUFFER_BIT)
+        update_screen(runs)
+        draw_screen()
+        glfw.swap_buffers(self.window)
+
+    async def stop(self):
+        self.drawing.submit(glfw.make_context_current, None)
+        self.drawing.shutdown()
 
 def reshape_window(w, h):
     # glClearColor(0.0, 0.0, 0.0, 0.0)
@@ -117,82 +230,18 @@ def reshape_window(w, h):
     # display_height = h
     ...
 
-def keyboard_down(key, x, y):
-    if key == '\033': # esc
-        sys.exit()
-
-    if key == '1':
-        my_chip8.key[0x1] = 1
-    elif key == '2':
-        my_chip8.key[0x2] = 1
-    elif key == '3':
-        my_chip8.key[0x3] = 1
-    elif key == '4':
-        my_chip8.key[0xC] = 1
-
-    elif key == 'q':
-        my_chip8.key[0x4] = 1
-    elif key == 'w':
-        my_chip8.key[0x5] = 1
-    elif key == 'e':
-        my_chip8.key[0x6] = 1
-    elif key == 'r':
-        my_chip8.key[0xD] = 1
-
-    elif key == 'a':
-        my_chip8.key[0x7] = 1
-    elif key == 's':
-        my_chip8.key[0x8] = 1
-    elif key == 'd':
-        my_chip8.key[0x9] = 1
-    elif key == 'f':
-        my_chip8.key[0xE] = 1
-
-    elif key == 'z':
-        my_chip8.key[0xA] = 1
-    elif key == 'x':
-        my_chip8.key[0x0] = 1
-    elif key == 'c':
-        my_chip8.key[0xB] = 1
-    elif key == 'v':
-        my_chip8.key[0xF] = 1
-
-def keyboard_up(key, x, y):
-    if key == '1':
-        my_chip8.key[0x1] = 0
-    elif key == '2':
-        my_chip8.key[0x2] = 0
-    elif key == '3':
-        my_chip8.key[0x3] = 0
-    elif key == '4':
-        my_chip8.key[0xC] = 0
-
-    elif key == 'q':
-        my_chip8.key[0x4] = 0
-    elif key == 'w':
-        my_chip8.key[0x5] = 0
-    elif key == 'e':
-        my_chip8.key[0x6] = 0
-    elif key == 'r':
-        my_chip8.key[0xD] = 0
-
-    elif key == 'a':
-        my_chip8.key[0x7] = 0
-    elif key == 's':
-        my_chip8.key[0x8] = 0
-    elif key == 'd':
-        my_chip8.key[0x9] = 0
-    elif key == 'f':
-        my_chip8.key[0xE] = 0
-
-    elif key == 'z':
-        my_chip8.key[0xA] = 0
-    elif key == 'x':
-        my_chip8.key[0x0] = 0
-    elif key == 'c':
-        my_chip8.key[0xB] = 0
-    elif key == 'v':
-        my_chip8.key[0xF] = 0
+# The \a makes the terminal beep
+def beep(my_chip8):
+    print("\a", end='', flush=True)
+
+def key_callback(window, key, scancode, action, mods):
+    global rewinding
+    if key == glfw.KEY_ESCAPE:
+        glfw.set_window_should_close(window, True)
+    elif key == rewind_key:
+        rewinding = action != glfw.RELEASE
+    elif key in keypad and action != glfw.REPEAT:
+        recorder.set_key(keypad[key], 1 if action == glfw.PRESS else 0)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,118 @@
+import hashlib
+import struct
+
+# Movies record every key press and release in a run, so that the run can be
+# played back exactly without anyone at the keyboard.
+#
+# Key changes only reach the machine between frames, so events are stamped
+# with the machine's frame_count rather than a count of instructions. Frames
+# skipped by fast_forward are still counted, so a movie plays back the same
+# with or without skipping.
+#
+# A movie file is a header of a magic number, the version of the format, the
+# random seed, instructions per frame, the number of frames recorded and the
+# SHA-1 of the game, followed by one record of frame, key and state per event.
+movie_magic = b'CH8M'
+movie_version = 2
+movie_header = struct.Struct('<4sBIHI20s')
+movie_event = struct.Struct('<IBB')
+
+class Movie:
+    # frames is how long the run went on for, which defaults to just after
+    # the last event
+    def __init__(self, game_hash, seed=0, cycles_per_frame=10, events=None, frames=None):
+        self.game_hash = game_hash
+        self.seed = seed
+        self.cycles_per_frame = cycles_per_frame
+        self.events = events if events is not None else []
+        self.frames = frames
+
+    def length(self):
+        if self.frames is not None:
+            return self.frames
+        return self.events[-1][0] + 1 if self.events else 0
+
+    def save(self, path):
+        with open(path, 'wb') as movie_file:
+            movie_file.write(movie_header.pack(
+                movie_magic,
+                movie_version,
+                # Only the low 32 bits of a seed matter to XorShift
+                self.seed & 0xFFFFFFFF,
+                self.cycles_per_frame,
+                self.length(),
+                self.game_hash,
+            ))
+            movie_file.write(b''.join(movie_event.pack(*event) for event in self.events))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as movie_file:
+            data = movie_file.read()
+        magic, version, seed, cycles_per_frame, frames, game_hash = movie_header.unpack_from(data)
+        if magic != movie_magic:
+            raise ValueError("%s is not a movie" % path)
+        if version != movie_version:
+            raise ValueError("Movie is version %d, expected %d" % (version, movie_version))
+        events = list(movie_event.iter_unpack(data[movie_header.size:]))
+        return cls(game_hash, seed, cycles_per_frame, events, frames)
+
+def hash_game(game):
+    with open(game, 'rb') as game_file:
+        return hashlib.sha1(game_file.read()).digest()
+
+# Sits between the frontend and the machine, passing key changes on and
+# logging them. This should be made just after the machine's reset, so that
+# its random numbers start from the seed that is recorded.
+class Recorder:
+    def __init__(self, my_chip8, game):
+        self.my_chip8 = my_chip8
+        self.movie = Movie(hash_game(game), my_chip8.seed, my_chip8.cycles_per_frame)
+
+    def set_key(self, key, state):
+        self.my_chip8.key[key] = state
+        self.movie.events.append((self.my_chip8.frame_count, key, state))
+
+    # After the machine has been stepped back, forget the key changes from the
+    # frames it is now before, and add any needed to get from the keys the
+    # movie has held then to the keys held now
+    def rewind(self):
+        frame_count = self.my_chip8.frame_count
+        events = [event for event in self.movie.events if event[0] < frame_count]
+        held = bytearray(16)
+        for (frame, key, state) in events:
+            held[key] = state
+        for key in range(0, 16):
+            if self.my_chip8.key[key] != held[key]:
+                events.append((frame_count, key, self.my_chip8.key[key]))
+        self.movie.events = events
+
+    # The movie lasts up to the frame the machine has got to
+    def save(self, path):
+        self.movie.frames = self.my_chip8.frame_count
+        self.movie.save(path)
+
+# Play a movie back into a machine that has just had its game loaded, as fast
+# as possible, for as many frames as were recorded or a set number of frames.
+# Returns the number of instructions run.
+def replay(my_chip8, movie, frames=None, blocks=False):
+    my_chip8.cycles_per_frame = movie.cycles_per_frame
+    my_chip8.seed_random(movie.seed)
+    events = list(movie.events)
+    if frames is None:
+        frames = movie.length()
+
+    counter = 0
+    while my_chip8.frame_count < frames:
+        while events and events[0][0] <= my_chip8.frame_count:
+            frame, key, state = events.pop(0)
+            my_chip8.key[key] = state
+        counter += my_chip8.run_frame(blocks)
+        # Skip frames spent waiting on the delay timer, but always run the
+        # frame before the next key change and the last frame, so that the
+        # program has read the timer as it would have by then
+        limit = frames - my_chip8.frame_count - 1
+        if events:
+            limit = min(limit, events[0][0] - my_chip8.frame_count - 1)
+        my_chip8.fast_forward(limit)
+    return counter
@@ -0,0 +1,75 @@
+import json
+import math
+import time
+from array import array
+
+# Counts where a program spends its time. Attach it to a machine with
+# my_chip8.attach(profiler), and it counts every instruction run by opcode
+# family (the first 4 bits), by handler, and by address, along with the wall
+# time spent in each handler.
+class Profiler:
+    def __init__(self):
+        self.family_counts = [0] * 16
+        self.handler_counts = {}
+        self.handler_seconds = {}
+        self.address_counts = array('I', bytes(4 * 4096))
+        self.start = 0.0
+
+    def before(self, my_chip8, handler):
+        self.address_counts[my_chip8.program_counter] += 1
+        self.start = time.perf_counter()
+
+    def after(self, my_chip8, handler):
+        elapsed = time.perf_counter() - self.start
+        name = handler.__name__
+        self.family_counts[my_chip8.opcode >> 12] += 1
+        self.handler_counts[name] = self.handler_counts.get(name, 0) + 1
+        self.handler_seconds[name] = self.handler_seconds.get(name, 0.0) + elapsed
+
+    def total(self):
+        return sum(self.family_counts)
+
+    # Given the analysis of the game from disassembler.load_analysis(), the
+    # report also counts the times each basic block was entered, and the
+    # instructions run in each subroutine
+    def report(self, analysis=None):
+        report = {
+            'instructions': self.total(),
+            'families': {'%X' % family: count for (family, count) in enumerate(self.family_counts) if count},
+            'handlers': {
+                name: {'count': count, 'seconds': self.handler_seconds[name]}
+                for (name, count) in self.handler_counts.items()
+            },
+            'addresses': {'%03x' % address: count for (address, count) in enumerate(self.address_counts) if count},
+        }
+        if analysis is not None:
+            ends = {block['start']: block['end'] for block in analysis['blocks']}
+            report['blocks'] = {'%03x' % start: self.address_counts[start] for start in ends}
+            report['subroutines'] = {
+                '%03x' % subroutine['entry']: sum(sum(self.address_counts[start:ends[start]]) for start in subroutine['blocks'])
+                for subroutine in analysis['subroutines']
+            }
+        return report
+
+    def write_json(self, path, analysis=None):
+        with open(path, 'w') as report_file:
+            json.dump(self.report(analysis), report_file, indent=2)
+
+    # A table of handlers, busiest first
+    def table(self):
+        total = self.total() or 1
+        lines = ["%-10s %12s %7s %12s %10s" % ('handler', 'count', '%', 'seconds', 'ns each')]
+        for (name, count) in sorted(self.handler_counts.items(), key=lambda item: -item[1]):
+            seconds = self.handler_seconds[name]
+            lines.append("%-10s %12d %6.2f%% %12.6f %10.0f" % (
+                name, count, 100.0 * count / total, seconds, seconds * 1e9 / count))
+        return '\n'.join(lines)
+
+    # The count for each address as a 64x64 greyscale PGM image, one pixel
+    # per byte of memory, on a log scale so that the quieter code still shows
+    def write_heatmap(self, path):
+        busiest = max(self.address_counts) or 1
+        scale = 255.0 / math.log2(busiest + 1)
+        pixels = bytes(int(math.log2(count + 1) * scale) for count in self.address_counts)
+        with open(path, 'wb') as image_file:
+            image_file.write(b'P5\n64 64\n255\n' + pixels)
@@ -0,0 +1,97 @@
+from collections import deque
+
+import numpy as np
+
+# Records the machine's state every frame so that it can be stepped backwards.
+#
+# Every keyframe_interval frames a whole saved state is kept as a keyframe.
+# The frames in between only keep the chunks of their state that differ from
+# the keyframe, XORed against it. The state is split into 64 byte chunks: the
+# registers, then pages of memory, then rows of the screen, so a frame that
+# moves one sprite only stores a few rows and whatever memory it touched.
+#
+# Frames are kept in groups of a keyframe and the deltas made from it, along
+# with the machine's frame_count at each, which isn't part of a saved state.
+# When the total size goes over max_megabytes the oldest group is thrown away.
+class Rewind:
+    chunk_size = 64
+
+    def __init__(self, my_chip8, keyframe_interval=60, max_megabytes=16):
+        self.my_chip8 = my_chip8
+        self.keyframe_interval = keyframe_interval
+        self.max_bytes = max_megabytes * 1024 * 1024
+        self.groups = deque()
+        self.size = 0
+
+        # Memory and graphics are the last 4096 + 2048 bytes of a saved state.
+        # The registers before them are padded out to whole chunks, so that
+        # memory pages and screen rows start on a chunk.
+        self.registers_size = my_chip8.state_size - 4096 - 2048
+        self.padding = -self.registers_size % self.chunk_size
+        self.chunk_count = (my_chip8.state_size + self.padding) // self.chunk_size
+
+    def __len__(self):
+        return sum(len(group[1]) + 1 for group in self.groups)
+
+    # Record the current state, at the end of a frame
+    def record(self):
+        state = self.chunks(self.my_chip8.save_state())
+        if not self.groups or len(self.groups[-1][1]) + 1 >= self.keyframe_interval:
+            self.groups.append((state, [], [self.my_chip8.frame_count]))
+            self.size += state.nbytes
+        else:
+            keyframe, deltas, frame_counts = self.groups[-1]
+            frame_counts.append(self.my_chip8.frame_count)
+            difference = state ^ keyframe
+            changed = np.flatnonzero(difference.any(axis=1)).astype(np.uint16)
+            delta = (changed, difference[changed])
+            deltas.append(delta)
+            self.size += changed.nbytes + delta[1].nbytes
+
+        while self.size > self.max_bytes and len(self.groups) > 1:
+            keyframe, deltas, frame_counts = self.groups.popleft()
+            self.size -= keyframe.nbytes + sum(changed.nbytes + data.nbytes for (changed, data) in deltas)
+
+    # Throw away the latest recorded frame, and put the machine back to the
+    # one before it. Returns False, leaving the machine at the oldest frame
+    # still kept, once there is nothing further back to go.
+    def step_back(self):
+        if not self.groups:
+            return False
+        if len(self) > 1:
+            keyframe, deltas, frame_counts = self.groups[-1]
+            if deltas:
+                frame_counts.pop()
+                changed, data = deltas.pop()
+                self.size -= changed.nbytes + data.nbytes
+            else:
+                self.groups.pop()
+                self.size -= keyframe.nbytes
+            stepped = True
+        else:
+            stepped = False
+
+        keyframe, deltas, frame_counts = self.groups[-1]
+        state = keyframe
+        if deltas:
+            changed, data = deltas[-1]
+            state = keyframe.copy()
+            state[changed] ^= data
+        # The keys are whatever is held down now, not what was held then, or
+        # keys let go of while rewinding would stay pressed
+        keys = bytes(self.my_chip8.key)
+        self.my_chip8.load_state(self.unchunk(state))
+        self.my_chip8.key[:] = keys
+        self.my_chip8.frame_count = frame_counts[-1]
+        self.my_chip8.draw_flag = True
+        return stepped
+
+    def chunks(self, state):
+        padded = np.zeros(self.chunk_count * self.chunk_size, dtype=np.uint8)
+        padded[0:self.registers_size] = np.frombuffer(state, dtype=np.uint8, count=self.registers_size)
+        padded[self.registers_size + self.padding:] = np.frombuffer(state, dtype=np.uint8, offset=self.registers_size)
+        return padded.reshape(self.chunk_count, self.chunk_size)
+
+    def unchunk(self, chunks):
+        padded = chunks.reshape(-1)
+        return padded[0:self.registers_size].tobytes() + padded[self.registers_size + self.padding:].tobytes()
@@ -0,0 +1,187 @@
+import asyncio
+import struct
+
+import numpy as np
+
+# Runs a machine in real time alongside any number of front ends, each as
+# separate asyncio tasks on their own clocks:
+#
+# - Emulation runs a frame every 60th of a second, which is the instructions
+#   for the frame and then a tick of the timers, as in run_frame. The timers
+#   stay with the frames so that runs and movies are the same however the
+#   frames are paced. If it falls more than max_catch_up_frames behind, the
+#   missed frames are dropped instead of running the game fast to catch up.
+# - Each front end's poll() is called poll_hz times a second, to read input.
+# - Each front end's present() is awaited present_hz times a second, or as
+#   often as it will go if present_hz is None. A present that is slow only
+#   holds up its own front end, which then skips to the latest screen, as
+#   long as it awaits the slow part rather than blocking the event loop.
+#
+# The step run for each frame defaults to run_frame, and can be swapped for
+# anything else, such as stepping back through a Rewind. Whatever number of
+# instructions it returns is added up in instructions.
+class Runtime:
+    max_catch_up_frames = 5
+
+    def __init__(self, my_chip8, frontends=(), step=None):
+        self.my_chip8 = my_chip8
+        self.frontends = list(frontends)
+        self.step = step or my_chip8.run_frame
+        self.frame_time = 1.0 / my_chip8.timer_hz
+        self.frames = 0
+        self.instructions = 0
+        self.dropped_frames = 0
+        self.stopped = None
+
+    def stop(self):
+        self.stopped.set()
+
+    # Run until stop() is called, for a number of seconds, or until a task
+    # raises, in which case the front ends are stopped and it is raised again
+    async def run(self, seconds=None):
+        self.stopped = asyncio.Event()
+        tasks = [asyncio.create_task(self.emulate())]
+        for frontend in self.frontends:
+            await frontend.start(self)
+            tasks.append(asyncio.create_task(self.present(frontend)))
+            if frontend.poll_hz:
+                tasks.append(asyncio.create_task(self.poll(frontend)))
+        stopped = asyncio.create_task(self.stopped.wait())
+        try:
+            await asyncio.wait(tasks + [stopped], timeout=seconds, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks + [stopped]:
+                task.cancel()
+            await asyncio.gather(*tasks, stopped, return_exceptions=True)
+            for frontend in self.frontends:
+                await frontend.stop()
+        for task in tasks:
+            if not task.cancelled() and task.exception():
+                raise task.exception()
+
+    async def emulate(self):
+        loop = asyncio.get_running_loop()
+        next_frame = loop.time()
+        while True:
+            frames = 0
+            while loop.time() >= next_frame and frames < self.max_catch_up_frames:
+                self.instructions += self.step() or 0
+                self.frames += 1
+                frames += 1
+                next_frame += self.frame_time
+            if loop.time() >= next_frame:
+                behind = int((loop.time() - next_frame) / self.frame_time) + 1
+                self.dropped_frames += behind
+                next_frame += behind * self.frame_time
+            await asyncio.sleep(next_frame - loop.time())
+
+    async def poll(self, frontend):
+        interval = 1.0 / frontend.poll_hz
+        while True:
+            frontend.poll(self)
+            await asyncio.sleep(interval)
+
+    async def present(self, frontend):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await frontend.present(self.my_chip8)
+            if frontend.present_hz:
+                await asyncio.sleep(1.0 / frontend.present_hz - (loop.time() - start))
+            else:
+                await asyncio.sleep(0)
+
+# The methods a front end can have, all doing nothing by default
+class Frontend:
+    present_hz = 60
+    poll_hz = 0
+
+    async def start(self, runtime):
+        pass
+
+    def poll(self, runtime):
+        pass
+
+    async def present(self, my_chip8):
+        pass
+
+    async def stop(self):
+        pass
+
+# Packs the rows of the screen changed since a generation into runs of
+# neighbouring rows, as (start, stop, pixels), with the pixels packed 8 to a
+# byte, so 8 bytes a row
+def changed_runs(my_chip8, since):
+    rows = my_chip8.changed_rows(since)
+    if len(rows) == 0:
+        return []
+    runs = []
+    for run in np.split(rows, np.flatnonzero(np.diff(rows) != 1) + 1):
+        start, stop = int(run[0]), int(run[-1]) + 1
+        runs.append((start, stop, np.packbits(my_chip8.screen[start:stop], axis=1).tobytes()))
+    return runs
+
+# Writes the screen to a file every time it changes, as a stream of binary
+# PBM images that most video tools can read. Writing happens in a thread, so
+# a slow disk only makes frames get skipped.
+class ScreenRecorder(Frontend):
+    def __init__(self, path):
+        self.path = path
+        self.presented = 0
+        self.frames_written = 0
+
+    async def start(self, runtime):
+        self.file = open(self.path, 'wb')
+
+    async def present(self, my_chip8):
+        if my_chip8.generation == self.presented:
+            return
+        self.presented = my_chip8.generation
+        image = b'P4\n%d %d\n' % (my_chip8.screen_width, my_chip8.screen_height)
+        image += np.packbits(my_chip8.screen, axis=1).tobytes()
+        await asyncio.to_thread(self.file.write, image)
+        self.frames_written += 1
+
+    async def stop(self):
+        self.file.close()
+
+# Serves the screen over TCP. Each client is sent the whole screen when it
+# connects, and then the runs of rows that change, as a header of the
+# generation, first row and number of rows, then 8 bytes for each row. A
+# client that reads slowly gets fewer, larger updates.
+class ScreenStreamer(Frontend):
+    update_header = struct.Struct('<IBB')
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.clients = {}
+
+    async def start(self, runtime):
+        self.server = await asyncio.start_server(self.connected, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def connected(self, reader, writer):
+        self.clients[writer] = 0
+
+    async def present(self, my_chip8):
+        for (writer, presented) in list(self.clients.items()):
+            if writer.is_closing():
+                del self.clients[writer]
+                continue
+            for (start, stop, pixels) in changed_runs(my_chip8, presented):
+                writer.write(self.update_header.pack(my_chip8.generation & 0xFFFFFFFF, start, stop - start) + pixels)
+            self.clients[writer] = my_chip8.generation
+        await asyncio.gather(*(self.drain(writer) for writer in list(self.clients)))
+
+    async def drain(self, writer):
+        try:
+            await writer.drain()
+        except ConnectionError:
+            writer.close()
+
+    async def stop(self):
+        for writer in self.clients:
+            writer.close()
+        self.server.close()
+        await self.server.wait_closed()
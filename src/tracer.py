@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import struct
+import sys
+
+import numpy as np
+
+# Traces every instruction a machine runs as one fixed size record. Attach
+# it to a machine with my_chip8.attach(tracer).
+#
+# A record holds the number of the instruction since tracing started, its
+# address and opcode, I after it ran, the register it changed with the value
+# before and after, and VF after. When more than one register changes, the
+# one recorded is the lowest other than VF. If none changed the register is
+# 0xFF. A trace file is a header of a magic number, the version of the
+# format and the size of a record, followed by the records.
+#
+# Records are kept in memory and written out in large blocks. Given ring=N
+# instead of a file, only the last N records are kept, to be saved once
+# something has gone wrong.
+trace_magic = b'CH8T'
+trace_version = 1
+trace_header = struct.Struct('<4sBB')
+trace_record = struct.Struct('<IHHHBBBBxx')
+no_register = 0xFF
+
+# The same records as a numpy type, for reading them back
+record_dtype = np.dtype([
+    ('cycle', '<u4'), ('pc', '<u2'), ('opcode', '<u2'), ('i', '<u2'),
+    ('register', 'u1'), ('old', 'u1'), ('new', 'u1'), ('vf', 'u1'), ('padding', 'V2'),
+])
+
+class Tracer:
+    def __init__(self, trace_file=None, ring=None, buffer_records=65536):
+        self.trace_file = trace_file
+        self.ring = ring
+        self.buffer_records = buffer_records
+        self.buffer = bytearray()
+        self.cycle = 0
+        if ring:
+            self.buffer = bytearray(ring * trace_record.size)
+        elif trace_file is not None:
+            trace_file.write(trace_header.pack(trace_magic, trace_version, trace_record.size))
+
+    def before(self, my_chip8, handler):
+        self.program_counter = my_chip8.program_counter
+        self.v = bytes(my_chip8.v)
+
+    def after(self, my_chip8, handler):
+        v = my_chip8.v
+        register, old, new = no_register, 0, 0
+        if v != self.v:
+            for index in range(0, 16):
+                if v[index] != self.v[index]:
+                    register = index
+                    if index != 0xF:
+                        break
+            old = self.v[register]
+            new = v[register]
+        record = trace_record.pack(self.cycle & 0xFFFFFFFF, self.program_counter, my_chip8.opcode,
+                                   my_chip8.i & 0xFFFF, register, old, new, v[0xF])
+        if self.ring:
+            offset = self.cycle % self.ring * trace_record.size
+            self.buffer[offset:offset + trace_record.size] = record
+        else:
+            self.buffer += record
+            if len(self.buffer) >= self.buffer_records * trace_record.size:
+                self.flush()
+        self.cycle += 1
+
+    def flush(self):
+        if self.trace_file is not None and not self.ring:
+            self.trace_file.write(self.buffer)
+            self.buffer = bytearray()
+
+    # The records kept, oldest first
+    def records(self):
+        if not self.ring:
+            return bytes(self.buffer)
+        count = min(self.cycle, self.ring)
+        start = (self.cycle - count) % self.ring * trace_record.size
+        end = start + count * trace_record.size
+        if end <= len(self.buffer):
+            return bytes(self.buffer[start:end])
+        return bytes(self.buffer[start:]) + bytes(self.buffer[0:end - len(self.buffer)])
+
+    # Write a trace file of the records kept in the ring
+    def save(self, path):
+        with open(path, 'wb') as trace_file:
+            trace_file.write(trace_header.pack(trace_magic, trace_version, trace_record.size))
+            trace_file.write(self.records())
+
+def load(path):
+    with open(path, 'rb') as trace_file:
+        magic, version, record_size = trace_header.unpack(trace_file.read(trace_header.size))
+    if magic != trace_magic:
+        raise ValueError("%s is not a trace" % path)
+    if version != trace_version or record_size != trace_record.size:
+        raise ValueError("Trace is version %d, expected %d" % (version, trace_version))
+    if os.path.getsize(path) == trace_header.size:
+        return np.zeros(0, dtype=record_dtype)
+    return np.memmap(path, dtype=record_dtype, mode='r', offset=trace_header.size)
+
+# Turn an opcode pattern such as 8XY4 or D00N, where any letter other than
+# A to F matches anything, into a mask and the value to match under it
+def opcode_pattern(pattern):
+    if len(pattern) != 4:
+        raise ValueError("Opcode patterns are 4 characters, not %r" % pattern)
+    mask = value = 0
+    for character in pattern.upper():
+        mask <<= 4
+        value <<= 4
+        if character in '0123456789ABCDEF':
+            mask |= 0xF
+            value |= int(character, 16)
+    return mask, value
+
+def select(records, opcode=None, address=None, register=None):
+    chosen = np.ones(len(records), dtype=bool)
+    if opcode is not None:
+        mask, value = opcode_pattern(opcode)
+        chosen &= (records['opcode'] & mask) == value
+    if address is not None:
+        start, stop = address
+        chosen &= (records['pc'] >= start) & (records['pc'] < stop)
+    if register is not None:
+        chosen &= records['register'] == register
+    return records[chosen]
+
+def describe(record):
+    line = "%10d  %03x  %04x  I=%03x" % (record['cycle'], record['pc'], record['opcode'], record['i'])
+    if record['register'] != no_register:
+        line += "  V%X %02x -> %02x" % (record['register'], record['old'], record['new'])
+    return line
+
+# Counts of records by opcode family and the busiest addresses
+def summary(records, top=10):
+    lines = ["%d instructions" % len(records)]
+    families = np.bincount(records['opcode'] >> 12, minlength=16)
+    lines += ["%Xxxx  %10d" % (family, count) for (family, count) in enumerate(families) if count]
+    addresses = np.bincount(records['pc'], minlength=4096)
+    for address in np.argsort(addresses)[::-1][:top]:
+        if addresses[address]:
+            lines.append("%03x   %10d" % (address, addresses[address]))
+    return '\n'.join(lines)
+
+def address_range(text):
+    start, _, stop = text.partition('-')
+    start = int(start, 16)
+    return (start, int(stop, 16) + 1 if stop else start + 1)
+
+def main():
+    parser = argparse.ArgumentParser(description='Read an instruction trace written by headless.py --trace')
+    parser.add_argument('trace', help='Path to the trace')
+    parser.add_argument('--opcode', help='Only show opcodes matching a pattern such as 8XY4 or D01N')
+    parser.add_argument('--address', type=address_range, help='Only show instructions at an address, or a range such as 200-2ff, in hex')
+    parser.add_argument('--register', type=lambda text: int(text, 16), help='Only show instructions that changed this register')
+    parser.add_argument('--last', type=int, help='Only show the last this many matches')
+    parser.add_argument('--summary', action='store_true', help='Count the matches by opcode and address instead of listing them')
+    args = parser.parse_args()
+
+    records = select(load(args.trace), args.opcode, args.address, args.register)
+    if args.last:
+        records = records[-args.last:]
+    if args.summary:
+        print(summary(records))
+    else:
+        try:
+            for record in records:
+                print(describe(record))
+        except BrokenPipeError:
+            sys.stderr.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from src import chip8
+from tests.roms import roms
+
+# Times the core of the emulator, so that a change can be checked for making
+# it slower. Run from the top of the repository:
+#
+#   python -m tests.benchmarks --save
+#   python -m tests.benchmarks --compare .benchmarks/1a2b3c4.json
+#
+# Every result is the best of a number of runs, in nanoseconds per
+# instruction or per call, so lower is always better. --save stores the
+# results under .benchmarks, named after the current commit, and --compare
+# fails if any result is more than --threshold slower than the one stored.
+
+# Straight runs of one instruction, given as the opcode to put at each
+# address. V0 and V1 are 0 and I points at 0x400, past the end of the run.
+dispatch_cases = {
+    '00E0': lambda address: 0x00E0,
+    '1NNN': lambda address: 0x1000 | (address + 2),
+    # Call, jump to the next call after it, return from it
+    '2NNN 1NNN 00EE': lambda address: (0x2000 | (address + 4), 0x1000 | (address + 4), 0x00EE)[(address - 0x200) // 2 % 3],
+    '3XNN': lambda address: 0x3001,
+    '6XNN': lambda address: 0x6012,
+    '7XNN': lambda address: 0x7001,
+    '8XY4': lambda address: 0x8014,
+    '8XY6': lambda address: 0x8016,
+    'ANNN': lambda address: 0xA400,
+    'CXNN': lambda address: 0xC0FF,
+    'D011': lambda address: 0xD011,
+    'D014': lambda address: 0xD014,
+    'D018': lambda address: 0xD018,
+    'D01F': lambda address: 0xD01F,
+    'EX9E': lambda address: 0xE09E,
+    'FX07': lambda address: 0xF007,
+    'FX15': lambda address: 0xF015,
+    'FX1E': lambda address: 0xF01E,
+    'FX29': lambda address: 0xF029,
+    'FX33': lambda address: 0xF033,
+    'FX55': lambda address: 0xF055,
+    'FX65': lambda address: 0xF065,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the Chip8 core')
+    parser.add_argument('--filter', default='', help='Only run the benchmarks with this in their name')
+    parser.add_argument('--save', nargs='?', const='', help='Store the results in .benchmarks, named after the current commit by default')
+    parser.add_argument('--compare', help='Results stored by an earlier --save to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1, help='How much slower a result can be than before without failing, 0.1 for 10%%')
+    args = parser.parse_args()
+
+    results = {}
+    for (name, benchmark) in benchmarks():
+        if args.filter in name:
+            results[name] = benchmark()
+            print("%-28s %12.0f ns" % (name, results[name]))
+
+    if args.save is not None:
+        save(results, args.save or commit())
+    if args.compare:
+        with open(args.compare) as compare_file:
+            before = json.load(compare_file)['results']
+        if not compare(before, results, args.threshold):
+            sys.exit(1)
+
+def benchmarks():
+    for (name, make) in dispatch_cases.items():
+        yield ('dispatch ' + name, lambda make=make: time_dispatch(make))
+    for name in roms:
+        yield ('rom %s' % name, lambda name=name: time_rom(roms[name]))
+        yield ('rom %s blocks' % name, lambda name=name: time_rom(roms[name], blocks=True))
+    yield ('load_game', time_load)
+    yield ('reset', time_reset)
+
+def new_chip8():
+    my_chip8 = chip8.Chip8(0)
+    my_chip8.initialise()
+    return my_chip8
+
+# Time one kind of instruction, by running a batch of them over and over.
+# The first run decodes them all, the rest run from the decode cache.
+def time_dispatch(make, batch=256, repeats=200):
+    my_chip8 = new_chip8()
+    for address in range(0x200, 0x200 + batch * 2, 2):
+        opcode = make(address)
+        my_chip8.memory[address] = opcode >> 8
+        my_chip8.memory[address + 1] = opcode & 0xFF
+
+    best = float('inf')
+    for repeat in range(0, repeats):
+        my_chip8.program_counter = 0x200
+        my_chip8.i = 0x400
+        my_chip8.stack_pointer = 0
+        my_chip8.v[0] = 0
+        my_chip8.v[1] = 0
+        execute_opcode = my_chip8.execute_opcode
+        start = time.perf_counter()
+        for counter in range(0, batch):
+            execute_opcode()
+        best = min(best, time.perf_counter() - start)
+    return best * 1e9 / batch
+
+# Time a whole program for a number of frames, the same way headless.py
+# runs them
+def time_rom(game, frames=600, blocks=False, repeats=3):
+    best = float('inf')
+    for repeat in range(0, repeats):
+        my_chip8 = new_chip8()
+        my_chip8.load_game(game)
+        counter = 0
+        start = time.perf_counter()
+        while my_chip8.frame_count < frames:
+            counter += my_chip8.run_frame(blocks)
+            my_chip8.fast_forward(frames - my_chip8.frame_count)
+        best = min(best, (time.perf_counter() - start) / counter)
+    return best * 1e9
+
+def time_load(repeats=1000):
+    my_chip8 = new_chip8()
+    game = roms['maze']
+    best = float('inf')
+    for repeat in range(0, repeats):
+        start = time.perf_counter()
+        my_chip8.load_game(game)
+        best = min(best, time.perf_counter() - start)
+    return best * 1e9
+
+def time_reset(repeats=1000):
+    my_chip8 = new_chip8()
+    best = float('inf')
+    for repeat in range(0, repeats):
+        start = time.perf_counter()
+        my_chip8.reset()
+        best = min(best, time.perf_counter() - start)
+    return best * 1e9
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def save(results, name):
+    os.makedirs('.benchmarks', exist_ok=True)
+    path = os.path.join('.benchmarks', name + '.json')
+    with open(path, 'w') as results_file:
+        json.dump({
+            'commit': commit(),
+            'python': platform.python_version(),
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'results': results,
+        }, results_file, indent=2)
+    print("Saved to %s" % path)
+
+# Print how each result has changed, returning False if any are slower by
+# more than the threshold
+def compare(before, after, threshold):
+    passed = True
+    for (name, result) in after.items():
+        if name not in before:
+            continue
+        change = result / before[name] - 1
+        regressed = change > threshold
+        passed = passed and not regressed
+        print("%-28s %12.0f ns %12.0f ns %+7.1f%%%s" % (
+            name, before[name], result, change * 100, '  SLOWER' if regressed else ''))
+    return passed
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,8 @@
 from src import chip8
+from tests.roms import roms
+import os
 import random
+import tempfile
 
 def setup():
     print("Setup!")
@@ -42,7 +45,7 @@ def test_00E0():
     # The program counter wants to have incremented, else we will be
     # clearing the screen forever
     assert my_chip8.program_counter == 0x202
-    assert my_chip8.graphics == [0] * (64 * 32)
+    assert my_chip8.graphics == bytearray(64 * 32)
 
 # Returns from a subroutine
 # Need to make sure we move to the correct memory address, and the stack
@@ -76,6 +79,22 @@ def test_00EE_2():
     assert my_chip8.program_counter == 0x638
     assert my_chip8.stack_pointer == 9
 
+# Returning with nothing on the stack is an error, and leaves the machine as
+# it was, so its state can still be saved
+def test_00EE_empty_stack():
+    my_chip8.reset()
+    my_chip8.memory[0x200] = 0x00
+    my_chip8.memory[0x201] = 0xEE
+    try:
+        my_chip8.emulate_cycle()
+    except IndexError:
+        pass
+    else:
+        assert False, 'returned with an empty stack'
+    assert my_chip8.stack_pointer == 0
+    my_chip8.load_state(my_chip8.save_state())
+    assert my_chip8.stack_pointer == 0
+
 # Jumps to address NNN
 # Move to the correct memory address and do not increment
 def test_1NNN():
@@ -605,17 +624,15 @@ def test_BNNN():
 # Sets VX to a random number AND NN (Assuming bitwise AND. Not really
 # sure about testing this as what is significant about a random number?)
 def test_CXNN():
-    # Re-initialise the system
-    my_chip8.reset()
+    # Re-initialise the system, with a known seed
+    my_chip8.reset(seed=123)
     # Set up mock situation
-    my_chip8.test_rand = True
-    ran = random.Random()
-    ran.seed(123)
+    ran = chip8.XorShift(123)
     my_chip8.memory[0x200] = 0xC4
     my_chip8.memory[0x201] = 0x20
     my_chip8.emulate_cycle()
     assert my_chip8.program_counter == 0x202
-    assert my_chip8.v[0x4] == (0x20 & ran.randint(0x0, 0xFF))
+    assert my_chip8.v[0x4] == (0x20 & ran.getrandbits(8))
 
 # Draws a sprite at coordinate (VX, VY) that has a width of 8 pixels
 # and a height of N pixels. Each row of 8 pixels is read as bit-coded
@@ -641,7 +658,7 @@ def test_DXYN():
     my_chip8.emulate_cycle()
     assert my_chip8.v[0xF] == 0
     assert my_chip8.program_counter == 0x202
-    assert my_chip8.graphics == mock_screen
+    assert list(my_chip8.graphics) == mock_screen
 
 # Skips the next instruction if the key stored in VX is pressed
 def test_EX9E_1():
@@ -720,9 +737,8 @@ def test_FX15():
     my_chip8.memory[0x200] = 0xF4
     my_chip8.memory[0x201] = 0x15
     my_chip8.emulate_cycle()
-    # Emulate cycle de-increments the timers at the end. We need to show
-    # this
-    assert my_chip8.delay_timer == 0xFF - 0x01
+    # The timers only count down once a frame, not every cycle
+    assert my_chip8.delay_timer == 0xFF
     assert my_chip8.program_counter == 0x202
 
 # Sets the sound timer to VX
@@ -735,9 +751,8 @@ def test_FX18():
     my_chip8.memory[0x200] = 0xF4
     my_chip8.memory[0x201] = 0x18
     my_chip8.emulate_cycle()
-    # Emulate cycle de-increments the timers at the end. We need to show
-    # this
-    assert my_chip8.sound_timer == 0xFF - 0x01
+    # The timers only count down once a frame, not every cycle
+    assert my_chip8.sound_timer == 0xFF
     assert my_chip8.program_counter == 0x202
 
 # Adds VX to I
@@ -773,6 +788,32 @@ def test_FX33():
     my_chip8.emulate_cycle()
     pass
 
+# The BCD digits are whole numbers, not the fractions you get from /
+def test_FX33_digits():
+    # Re-initialise the system
+    my_chip8.reset()
+    # Set up mock situation
+    my_chip8.i = 0x400
+    my_chip8.v[0x4] = 0xFE
+    my_chip8.memory[0x200] = 0xF4
+    my_chip8.memory[0x201] = 0x33
+    my_chip8.emulate_cycle()
+    assert my_chip8.program_counter == 0x202
+    assert my_chip8.memory[0x400:0x403] == bytearray([2, 5, 4])
+
+# The state views stay pointed at the machine after a reset
+def test_views():
+    # Re-initialise the system
+    my_chip8.reset()
+    views = my_chip8.views()
+    my_chip8.v[0x3] = 0x42
+    my_chip8.graphics[0x10] = 1
+    assert views['v'][0x3] == 0x42
+    assert views['graphics'][0x10] == 1
+    my_chip8.reset()
+    assert views['v'][0x3] == 0
+    assert views['memory'][0x0] == 0xF0
+
 # Stores V0 to VX in memory starting at address I
 def test_FX55():
     # Re-initialise the system
@@ -810,3 +851,473 @@ def test_FX65():
     assert my_chip8.v[0x1] == 0xAD
     assert my_chip8.v[0x2] == 0xBE
     assert my_chip8.v[0x3] == 0xEF
+
+# Instructions are only decoded once per address, so make sure that
+# storing over an instruction that has already run is picked up
+def test_decode_cache_invalidated_by_store():
+    # Re-initialise the system
+    my_chip8.reset()
+    # Set up mock situation. 0x200 sets V0, then 0x202 jumps back to it
+    # after FX55 has replaced it with 6077 (V0 = 0x77)
+    my_chip8.i = 0x200
+    my_chip8.v[0x0] = 0x60
+    my_chip8.v[0x1] = 0x77
+    my_chip8.memory[0x200] = 0x60
+    my_chip8.memory[0x201] = 0x12
+    my_chip8.memory[0x202] = 0xF1
+    my_chip8.memory[0x203] = 0x55
+    my_chip8.memory[0x204] = 0x12
+    my_chip8.memory[0x205] = 0x00
+    my_chip8.emulate_cycle()
+    assert my_chip8.v[0x0] == 0x12
+    my_chip8.v[0x0] = 0x60
+    my_chip8.emulate_cycle()
+    my_chip8.emulate_cycle()
+    assert my_chip8.program_counter == 0x200
+    my_chip8.emulate_cycle()
+    assert my_chip8.v[0x0] == 0x77
+
+# Runs of straight line code are compiled into one block. The block should
+# leave the machine exactly as running each instruction in turn would.
+def test_run_block():
+    program = [
+        0x60, 0xFE, # V0 = 0xFE
+        0x61, 0x03, # V1 = 0x03
+        0x80, 0x14, # V0 += V1, with carry
+        0x82, 0x06, # V2 >>= 1
+        0xA3, 0x00, # I = 0x300
+        0xF1, 0x1E, # I += V1
+        0x12, 0x00, # Jump to 0x200
+    ]
+    # Re-initialise the system
+    my_chip8.reset()
+    for (counter, byte) in enumerate(program):
+        my_chip8.memory[0x200 + counter] = byte
+    for counter in range(0, 7):
+        my_chip8.emulate_cycle()
+    expected = (list(my_chip8.v), my_chip8.i, my_chip8.program_counter)
+
+    my_chip8.reset()
+    for (counter, byte) in enumerate(program):
+        my_chip8.memory[0x200 + counter] = byte
+    assert my_chip8.run_block(7) == 7
+    assert (list(my_chip8.v), my_chip8.i, my_chip8.program_counter) == expected
+    assert my_chip8.v[0x0] == 0x01
+    assert my_chip8.v[0xF] == 0x00
+    assert my_chip8.i == 0x303
+
+# Blocks follow jumps and skips, so a loop runs in one go, but never for
+# more instructions than they are given
+def test_run_block_loop():
+    program = [
+        0x70, 0x01, # 200: V0 += 1
+        0x30, 0x00, # 202: Skip if V0 == 0
+        0x12, 0x00, # 204: Jump to 0x200
+        0x71, 0x01, # 206: V1 += 1
+        0x12, 0x00, # 208: Jump to 0x200
+    ]
+    # Re-initialise the system
+    my_chip8.reset()
+    for (counter, byte) in enumerate(program):
+        my_chip8.memory[0x200 + counter] = byte
+    other = my_chip8.clone()
+    for counter in range(0, 1000):
+        other.emulate_cycle()
+    assert my_chip8.run_block(1000) == 1000
+    assert my_chip8.save_state() == other.save_state()
+    assert my_chip8.v[0x1] == 1
+    assert my_chip8.run_block(2) == 2
+    assert my_chip8.program_counter == 0x204
+
+# A block that is stored over has to be recompiled before it runs again
+def test_run_block_self_modifying():
+    # Re-initialise the system
+    my_chip8.reset()
+    # 0x200 sets V2, then 0x202 stores 6177 (V1 = 0x77) over it and jumps back
+    my_chip8.i = 0x200
+    my_chip8.v[0x0] = 0x61
+    my_chip8.v[0x1] = 0x77
+    my_chip8.memory[0x200] = 0x62
+    my_chip8.memory[0x201] = 0x33
+    my_chip8.memory[0x202] = 0xF1
+    my_chip8.memory[0x203] = 0x55
+    my_chip8.memory[0x204] = 0x12
+    my_chip8.memory[0x205] = 0x00
+    my_chip8.run_block()
+    assert my_chip8.v[0x2] == 0x33
+    my_chip8.v[0x1] = 0x00
+    my_chip8.v[0x2] = 0x00
+    my_chip8.run_block(1)
+    assert my_chip8.program_counter == 0x200
+    my_chip8.run_block()
+    assert my_chip8.v[0x1] == 0x77
+    assert my_chip8.v[0x2] == 0x00
+
+# Games can be loaded from a file in one go
+def test_load_game_file():
+    # Re-initialise the system
+    my_chip8.reset()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'game.ch8')
+        with open(path, 'wb') as game_file:
+            game_file.write(bytes([0x12, 0x34, 0x56]))
+        assert my_chip8.load_game(path) == 3
+    assert my_chip8.memory[0x200:0x203] == bytearray([0x12, 0x34, 0x56])
+    assert my_chip8.memory[0x203] == 0
+
+# Games can be loaded from bytes, or anything else with a buffer
+def test_load_game_buffer():
+    # Re-initialise the system
+    my_chip8.reset()
+    assert my_chip8.load_game(bytes([0xA2, 0x2A])) == 2
+    assert my_chip8.load_game(bytearray([0x60, 0x0C])) == 2
+    assert my_chip8.memory[0x200:0x202] == bytearray([0x60, 0x0C])
+    my_chip8.emulate_cycle()
+    assert my_chip8.v[0x0] == 0x0C
+
+# A game bigger than the space after 0x200 is refused
+def test_load_game_too_big():
+    # Re-initialise the system
+    my_chip8.reset()
+    my_chip8.load_game(bytes([0xFF]) * 3584)
+    try:
+        my_chip8.load_game(bytes(3585))
+        assert False
+    except ValueError:
+        pass
+
+# Drawing over pixels that are already set turns them off, and sets VF
+def test_DXYN_collision():
+    # Re-initialise the system
+    my_chip8.reset()
+    # Set up mock situation
+    my_chip8.i = 0x000 # Start of 0
+    my_chip8.memory[0x200] = 0xD0
+    my_chip8.memory[0x201] = 0x05
+    my_chip8.memory[0x202] = 0xD0
+    my_chip8.memory[0x203] = 0x05
+    my_chip8.emulate_cycle()
+    assert my_chip8.v[0xF] == 0
+    assert my_chip8.graphics[0:4] == bytearray([1, 1, 1, 1])
+    my_chip8.emulate_cycle()
+    assert my_chip8.v[0xF] == 1
+    assert my_chip8.graphics == bytearray(64 * 32)
+
+# Sprites that go off the right or bottom of the screen are clipped, rather
+# than wrapping onto the next line or running off the end of the screen
+def test_DXYN_clipped():
+    # Re-initialise the system
+    my_chip8.reset()
+    # Set up mock situation
+    my_chip8.v[0x1] = 62
+    my_chip8.v[0x2] = 30
+    my_chip8.i = 0x000 # Start of 0, F0 90 90 90 F0
+    my_chip8.memory[0x200] = 0xD1
+    my_chip8.memory[0x201] = 0x25
+    my_chip8.emulate_cycle()
+    assert my_chip8.program_counter == 0x202
+    assert sum(my_chip8.graphics) == 3
+    assert my_chip8.graphics[30 * 64 + 62] == 1
+    assert my_chip8.graphics[30 * 64 + 63] == 1
+    assert my_chip8.graphics[31 * 64 + 62] == 1
+    assert my_chip8.graphics[31 * 64 + 0] == 0
+
+# Coordinates past the edge of the screen wrap around
+def test_DXYN_wrapped():
+    # Re-initialise the system
+    my_chip8.reset()
+    # Set up mock situation
+    my_chip8.v[0x1] = 64 + 2
+    my_chip8.v[0x2] = 32 + 1
+    my_chip8.i = 0x000 # Start of 0
+    my_chip8.memory[0x200] = 0xD1
+    my_chip8.memory[0x201] = 0x21
+    my_chip8.emulate_cycle()
+    assert my_chip8.graphics[64 + 2:64 + 6] == bytearray([1, 1, 1, 1])
+    assert sum(my_chip8.graphics) == 4
+
+# A frame runs a set number of instructions, and then counts down the timers
+def test_run_frame():
+    # Re-initialise the system
+    my_chip8.reset()
+    # Set up mock situation. 0x200 adds 1 to V0 and loops forever
+    my_chip8.delay_timer = 0x10
+    my_chip8.sound_timer = 0x01
+    my_chip8.memory[0x200] = 0x70
+    my_chip8.memory[0x201] = 0x01
+    my_chip8.memory[0x202] = 0x12
+    my_chip8.memory[0x203] = 0x00
+    assert my_chip8.run_frame() == my_chip8.cycles_per_frame
+    assert my_chip8.v[0x0] == my_chip8.cycles_per_frame // 2
+    assert my_chip8.delay_timer == 0x0F
+    assert my_chip8.sound_timer == 0x00
+    assert my_chip8.run_frame(blocks=True) == my_chip8.cycles_per_frame
+    assert my_chip8.delay_timer == 0x0E
+
+# A frame of blocks runs exactly the instructions a frame of the interpreter
+# does, so the timers tick at the same points and games play out the same
+def test_run_frame_blocks():
+    # A loop that reads the delay timer in every pass, then every catalogue game
+    timer_loop = bytes([0x60, 0x3C, 0xF0, 0x15, 0x71, 0x01, 0x72, 0x02, 0x73, 0x03,
+                        0xF4, 0x07, 0x84, 0x15, 0x12, 0x04])
+    for game in [timer_loop] + [roms[name] for name in sorted(roms)]:
+        my_chip8.reset(0)
+        my_chip8.load_game(game)
+        other = my_chip8.clone()
+        for frame in range(0, 30):
+            assert my_chip8.run_frame() == other.run_frame(blocks=True)
+        assert other.save_state() == my_chip8.save_state()
+
+# Waiting on a key press ends the frame early, as nothing can change until
+# the next one
+def test_run_frame_waiting_for_key():
+    # Re-initialise the system
+    my_chip8.reset()
+    # Set up mock situation
+    my_chip8.memory[0x200] = 0xF4
+    my_chip8.memory[0x201] = 0x0A
+    assert my_chip8.run_frame() == 1
+    assert my_chip8.waiting == 'key'
+    assert my_chip8.program_counter == 0x200
+    my_chip8.key[0x6] = 1
+    my_chip8.run_frame()
+    assert my_chip8.v[0x4] == 0x6
+    assert my_chip8.waiting is None
+
+# Spinning on the delay timer ends the frame early, and the frames until the
+# timer runs out can be skipped altogether
+def test_run_frame_waiting_for_timer():
+    program = [
+        0xF3, 0x07, # V3 = delay timer
+        0x33, 0x00, # Skip if V3 == 0
+        0x12, 0x00, # Jump to 0x200
+        0x71, 0x01, # V1 += 1
+    ]
+    # Re-initialise the system
+    my_chip8.reset()
+    for (counter, byte) in enumerate(program):
+        my_chip8.memory[0x200 + counter] = byte
+    my_chip8.delay_timer = 0x20
+    assert my_chip8.run_frame() == 1
+    assert my_chip8.waiting == 'timer'
+    assert my_chip8.delay_timer == 0x1F
+    assert my_chip8.fast_forward(100) == 0x1E
+    assert my_chip8.delay_timer == 0x01
+    my_chip8.run_frame()
+    assert my_chip8.v[0x3] == 0x01
+    assert my_chip8.delay_timer == 0x00
+    my_chip8.run_frame()
+    assert my_chip8.v[0x3] == 0x00
+    assert my_chip8.v[0x1] == 0x01
+
+# A batch of machines should end up exactly where the same number of single
+# machines would, when started from different registers
+def test_batch_matches_chip8():
+    program = [
+        0x61, 0x0A, # V1 = 0x0A
+        0x80, 0x14, # V0 += V1, with carry
+        0x82, 0x05, # V2 -= V0, with borrow
+        0x83, 0x0E, # V3 = V0 << 1
+        0x84, 0x07, # V4 = V0 - V4
+        0x85, 0x06, # V5 = V0 >> 1
+        0x30, 0x40, # Skip if V0 == 0x40
+        0x22, 0x28, # Call 0x228
+        0xA3, 0x00, # I = 0x300
+        0xF0, 0x33, # BCD of V0
+        0xF5, 0x55, # Store V0 to V5
+        0xA3, 0x10, # I = 0x310
+        0xF2, 0x65, # Load V0 to V2
+        0xF0, 0x29, # I = font for V0
+        0xD3, 0x45, # Draw at V3, V4
+        0xD3, 0x45, # Draw it again
+        0x8F, 0xF4, # VF += VF
+        0xF4, 0x1E, # I += V4
+        0x12, 0x24, # Jump to itself
+        0x00, 0x00, # Not used
+        0x86, 0x10, # 0x228: V6 = V1
+        0x86, 0x03, # V6 ^= V0
+        0x00, 0xEE, # Return
+    ]
+    start = [0x00, 0x01, 0x36, 0x40, 0x7F, 0x80, 0xF6, 0xFF]
+
+    batch = chip8.Chip8Batch(len(start))
+    batch.initialise()
+    batch.load_game(bytes(program))
+    batch.v[:, 0x0] = start
+    batch.v[:, 0x4] = 0x20
+    for counter in range(0, 40):
+        batch.execute_opcode()
+
+    for (lane, value) in enumerate(start):
+        my_chip8.reset()
+        my_chip8.load_game(bytes(program))
+        my_chip8.v[0x0] = value
+        my_chip8.v[0x4] = 0x20
+        for counter in range(0, 40):
+            my_chip8.emulate_cycle()
+        assert list(batch.v[lane]) == list(my_chip8.v)
+        assert batch.i[lane] == my_chip8.i
+        assert batch.program_counter[lane] == my_chip8.program_counter
+        assert batch.stack_pointer[lane] == my_chip8.stack_pointer
+        assert batch.memory[lane].tobytes() == bytes(my_chip8.memory)
+        assert batch.graphics[lane].tobytes() == bytes(my_chip8.graphics)
+
+# Each machine in a batch gets the random numbers a Chip8 with its seed would,
+# and starts them over on a reset
+def test_batch_CXNN_matches_chip8():
+    program = [
+        0xC0, 0xFF, # V0 = random
+        0xC1, 0x0F, # V1 = random & 0x0F
+        0x72, 0x01, # V2 += 1
+        0x12, 0x00, # Jump to 0x200
+    ]
+    batch = chip8.Chip8Batch(4, seed=[99, 0, 1, 99])
+    batch.initialise()
+    batch.load_game(bytes(program))
+    for counter in range(0, 41):
+        batch.execute_opcode()
+    first = batch.v.copy()
+    batch.reset()
+    batch.load_game(bytes(program))
+    for counter in range(0, 41):
+        batch.execute_opcode()
+    assert (batch.v == first).all()
+
+    for (lane, seed) in enumerate([99, 0, 1, 99]):
+        my_chip8.reset(seed=seed)
+        my_chip8.load_game(bytes(program))
+        for counter in range(0, 41):
+            my_chip8.emulate_cycle()
+        assert list(batch.v[lane]) == list(my_chip8.v)
+
+# A saved state can be restored, putting everything back as it was
+def test_save_and_load_state():
+    # Re-initialise the system
+    my_chip8.reset()
+    # Set up mock situation
+    my_chip8.load_game(bytes([0x60, 0x11, 0xA2, 0x34, 0x22, 0x00]))
+    my_chip8.emulate_cycle()
+    my_chip8.emulate_cycle()
+    my_chip8.emulate_cycle()
+    my_chip8.delay_timer = 0x12
+    my_chip8.key[0x3] = 1
+    my_chip8.graphics[0x40] = 1
+    state = my_chip8.save_state()
+    assert len(state) == my_chip8.state_size
+    compressed = my_chip8.save_state(compress=True)
+    assert len(compressed) < len(state)
+
+    for saved in (state, compressed):
+        my_chip8.reset()
+        my_chip8.load_state(saved)
+        assert my_chip8.program_counter == 0x200
+        assert my_chip8.i == 0x234
+        assert my_chip8.stack_pointer == 1
+        assert my_chip8.stack[0] == 0x204
+        assert my_chip8.v[0x0] == 0x11
+        assert my_chip8.delay_timer == 0x12
+        assert my_chip8.key[0x3] == 1
+        assert my_chip8.graphics[0x40] == 1
+        assert my_chip8.memory[0x200:0x206] == bytearray([0x60, 0x11, 0xA2, 0x34, 0x22, 0x00])
+        assert my_chip8.save_state() == state
+
+# A clone runs on without affecting the machine it came from
+def test_clone():
+    # Re-initialise the system
+    my_chip8.reset()
+    # Set up mock situation
+    my_chip8.load_game(bytes([0x70, 0x01, 0x12, 0x00]))
+    my_chip8.run_block(2)
+    other = my_chip8.clone()
+    assert other.save_state() == my_chip8.save_state()
+    other.run_block(2)
+    other.run_block(2)
+    assert other.v[0x0] == 3
+    assert my_chip8.v[0x0] == 1
+
+# Each machine has its own random numbers, which start over on a reset, and
+# are carried in saved states
+def test_CXNN_repeatable():
+    # Re-initialise the system, with a known seed
+    my_chip8.reset(seed=99)
+    # Set up mock situation. 0x200 sets V0 to a random byte, and loops
+    my_chip8.memory[0x200] = 0xC0
+    my_chip8.memory[0x201] = 0xFF
+    my_chip8.memory[0x202] = 0x12
+    my_chip8.memory[0x203] = 0x00
+    numbers = []
+    for counter in range(0, 20):
+        my_chip8.emulate_cycle()
+        my_chip8.emulate_cycle()
+        numbers.append(my_chip8.v[0x0])
+        if counter == 9:
+            state = my_chip8.save_state()
+    # They shouldn't all be the same number
+    assert len(set(numbers)) > 1
+
+    my_chip8.reset()
+    my_chip8.memory[0x200:0x204] = bytes([0xC0, 0xFF, 0x12, 0x00])
+    for counter in range(0, 20):
+        my_chip8.emulate_cycle()
+        my_chip8.emulate_cycle()
+        assert my_chip8.v[0x0] == numbers[counter]
+
+    my_chip8.load_state(state)
+    my_chip8.emulate_cycle()
+    my_chip8.emulate_cycle()
+    assert my_chip8.v[0x0] == numbers[10]
+
+# Unknown opcodes and beeps are counted, and passed on to listeners
+def test_events():
+    # Re-initialise the system
+    my_chip8.reset()
+    heard = []
+    listener = lambda chip8, *args: heard.append(args)
+    my_chip8.listen('unknown_opcode', listener)
+    my_chip8.listen('beep', listener)
+    assert my_chip8.event_counts == {}
+    # Set up mock situation. 0x200 is not an opcode, and loops forever
+    my_chip8.memory[0x200] = 0x0F
+    my_chip8.memory[0x201] = 0xFF
+    my_chip8.memory[0x202] = 0x12
+    my_chip8.memory[0x203] = 0x00
+    for counter in range(0, 40):
+        my_chip8.emulate_cycle()
+    my_chip8.sound_timer = 0x01
+    my_chip8.count_down_timers()
+    my_chip8.unlisten('unknown_opcode', listener)
+    my_chip8.unlisten('beep', listener)
+    my_chip8.emulate_cycle()
+
+    assert heard == [(0x0FFF, 0x200)] * 20 + [()]
+    assert my_chip8.event_counts == {'unknown_opcode': 21, 'beep': 1}
+    # A reset starts the counts, and the logging, over
+    my_chip8.reset()
+    assert my_chip8.event_counts == {}
+
+# Drawing marks only the rows the sprite covers as changed, and clearing the
+# screen marks them all
+def test_changed_rows():
+    # Re-initialise the system
+    my_chip8.reset()
+    generation = my_chip8.generation
+    assert list(my_chip8.changed_rows(generation - 1)) == list(range(0, 32))
+    assert len(my_chip8.changed_rows(generation)) == 0
+    # Set up mock situation. 0x200 draws digit 0 at (0, 30), clipped to 2 rows,
+    # then 0x202 draws it at (0, 4)
+    my_chip8.v[0x1] = 30
+    my_chip8.v[0x2] = 4
+    my_chip8.memory[0x200] = 0xD0
+    my_chip8.memory[0x201] = 0x15
+    my_chip8.memory[0x202] = 0xD0
+    my_chip8.memory[0x203] = 0x25
+    my_chip8.memory[0x204] = 0x00
+    my_chip8.memory[0x205] = 0xE0
+    my_chip8.emulate_cycle()
+    assert list(my_chip8.changed_rows(generation)) == [30, 31]
+    my_chip8.emulate_cycle()
+    assert list(my_chip8.changed_rows(generation)) == [4, 5, 6, 7, 8, 30, 31]
+    assert list(my_chip8.changed_rows(generation + 1)) == [4, 5, 6, 7, 8]
+    assert my_chip8.generation == generation + 2
+    my_chip8.emulate_cycle()
+    assert list(my_chip8.changed_rows(generation + 2)) == list(range(0, 32))
@@ -0,0 +1,47 @@
+from src import chip8
+from src import differential
+from tests.roms import roms
+
+def new_chip8(game):
+    my_chip8 = chip8.Chip8(0)
+    my_chip8.initialise()
+    my_chip8.load_game(game)
+    return my_chip8
+
+# The interpreter and the block compiler agree over every test program
+def test_backends_match():
+    for game in roms.values():
+        machines = [new_chip8(game), new_chip8(game)]
+        harness = differential.Differential(machines, ['uncached', 'blocks'], check_every=25)
+        assert harness.run(500) is None
+        assert harness.frame == 500
+        assert harness.instructions[0] == harness.instructions[1]
+
+# A broken way of running instructions is caught in the first frame it gets
+# something wrong in, even in the middle of a check
+def test_bisect():
+    # Gets 7XNN wrong when X is 3
+    def run_broken(my_chip8):
+        my_chip8.waiting = None
+        for counter in range(0, my_chip8.cycles_per_frame):
+            my_chip8.execute_opcode()
+            if my_chip8.opcode == 0x7301:
+                my_chip8.v[0x3] ^= 0x10
+        my_chip8.count_down_timers()
+        my_chip8.frame_count += 1
+        return my_chip8.cycles_per_frame
+
+    game = roms['counter']
+    # Find the first 0x7301 by running the program one frame at a time
+    my_chip8 = new_chip8(game)
+    while my_chip8.v[0x3] == 0:
+        program_counter = my_chip8.program_counter
+        my_chip8.run_frame()
+
+    machines = [new_chip8(game), new_chip8(game)]
+    harness = differential.Differential(machines, ['blocks', run_broken], check_every=100)
+    divergence = harness.run(500)
+    assert divergence['frame'] == my_chip8.frame_count - 1
+    assert divergence['program_counter'] == program_counter
+    assert divergence['instructions'] == [my_chip8.cycles_per_frame, my_chip8.cycles_per_frame]
+    assert divergence['differences'] == {'registers': [differential.registers_format.size + 0x3]}
@@ -0,0 +1,80 @@
+from src import chip8
+from src import disassembler
+from tests.roms import roms
+import os
+import tempfile
+
+def setup():
+    global my_chip8
+    my_chip8 = chip8.Chip8(0)
+    my_chip8.initialise()
+
+# Instructions come out as the usual mnemonics
+def test_disassemble():
+    my_chip8.reset()
+    size = my_chip8.load_game(roms['subroutines'])
+    listing = disassembler.disassemble(my_chip8, size)
+    assert listing[0:3] == [
+        (0x200, 0x6A00, 'LD VA, 00'),
+        (0x202, 0xA300, 'LD I, 300'),
+        (0x204, 0x220A, 'CALL 20A'),
+    ]
+    assert listing[-1] == (0x220, 0x00EE, 'RET')
+    # Every handler has a mnemonic
+    for opcode in range(0, 0x10000, 7):
+        disassembler.mnemonic(my_chip8.decode(opcode))
+
+# Blocks end at jumps, calls and skips, and start wherever those go
+def test_analyse():
+    my_chip8.reset()
+    size = my_chip8.load_game(roms['maze'])
+    analysis = disassembler.analyse(my_chip8, size)
+    blocks = [(block['start'], block['end'], block['successors']) for block in analysis['blocks']]
+    assert blocks == [
+        (0x200, 0x204, [0x204]),
+        (0x204, 0x20A, [0x20A, 0x20C]),
+        (0x20A, 0x20C, [0x20C]),
+        (0x20C, 0x212, [0x212, 0x214]),
+        (0x212, 0x214, [0x204]),
+        (0x214, 0x21A, [0x21A, 0x21C]),
+        (0x21A, 0x21C, [0x204]),
+        (0x21C, 0x21E, [0x200]),
+    ]
+    # The sprites after the code are never reached
+    assert max(address for (address, opcode, text) in analysis['instructions']) == 0x21C
+
+    my_chip8.reset()
+    size = my_chip8.load_game(roms['subroutines'])
+    analysis = disassembler.analyse(my_chip8, size)
+    assert analysis['subroutines'] == [{'entry': 0x20A, 'blocks': [0x20A]}]
+    assert analysis['blocks'][1]['calls'] == [0x20A]
+
+# The analysis is cached by the game's hash
+def test_load_analysis():
+    my_chip8.reset()
+    size = my_chip8.load_game(roms['maze'])
+    with tempfile.TemporaryDirectory() as directory:
+        analysis = disassembler.load_analysis(my_chip8, size, directory)
+        assert len(os.listdir(directory)) == 1
+        assert disassembler.load_analysis(my_chip8, size, directory) == analysis
+        # A cached result is used without analysing again
+        path = os.path.join(directory, os.listdir(directory)[0])
+        with open(path, 'w') as cache_file:
+            cache_file.write('{"cached": true}')
+        assert disassembler.load_analysis(my_chip8, size, directory) == {'cached': True}
+
+# The graph only has edges between blocks, even when a block runs off the end
+# of memory or into something that isn't code
+def test_dot():
+    my_chip8.reset()
+    size = my_chip8.load_game(roms['subroutines'])
+    analysis = disassembler.analyse(my_chip8, size)
+    # A successor that starts no block
+    analysis['blocks'][0]['successors'].append(0xFFE)
+    graph = disassembler.dot(analysis)
+    nodes = set(line.split()[0] for line in graph.splitlines() if '[label=' in line)
+    for line in graph.splitlines():
+        if '->' in line:
+            source, arrow, target = line.split()[0:3]
+            assert source in nodes and target in nodes
+    assert 'b20a [style=dashed]' in graph
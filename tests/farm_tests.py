@@ -0,0 +1,28 @@
+from src import farm
+import json
+import os
+import tempfile
+
+# Games that finished without an error are skipped when the farm is run
+# again, and anything else is run again
+def test_load_finished():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'results.jsonl')
+        assert farm.load_finished(path) == set()
+        with open(path, 'w') as results:
+            results.write(json.dumps({'game': 'a.ch8', 'frames': 600}) + '\n')
+            results.write(json.dumps({'game': 'b.ch8', 'error': 'IndexError()'}) + '\n')
+            # Cut short when the last run was stopped
+            results.write('{"game": "c.ch8", "fra')
+        assert farm.load_finished(path) == {'a.ch8'}
+
+# Games come from a directory, or a manifest of paths next to it
+def test_find_games():
+    with tempfile.TemporaryDirectory() as directory:
+        for name in ('b.ch8', 'a.ch8', 'notes.txt'):
+            open(os.path.join(directory, name), 'w').close()
+        assert farm.find_games(directory) == [os.path.join(directory, 'a.ch8'), os.path.join(directory, 'b.ch8')]
+        manifest = os.path.join(directory, 'games.txt')
+        with open(manifest, 'w') as manifest_file:
+            manifest_file.write('# Just one\nb.ch8\n\n')
+        assert farm.find_games(manifest) == [os.path.join(directory, 'b.ch8')]
@@ -0,0 +1,48 @@
+from src import chip8
+from src import fuzzer
+from tests.roms import roms
+import random
+
+def setup():
+    global my_chip8, base_state
+    my_chip8 = chip8.Chip8(0)
+    my_chip8.initialise()
+    base_state = my_chip8.save_state()
+
+# Coverage counts each way a branch goes, and how often
+def test_run_input():
+    # V0 comes back round to 0, skipping, every 256 times round the loop
+    coverage, crash = fuzzer.run_input(my_chip8, base_state, roms['counter'], (), 300)
+    assert crash is None
+    handlers = set(feature[0:2] for feature in coverage)
+    assert ('cpu3xxx', 'next') in handlers
+    assert ('cpu3xxx', 'skip') in handlers
+    assert ('cpu1xxx', 'back') in handlers
+    # The two 6XNN at the start run once each, making 2
+    assert ('cpu6xxx', 'next', (2).bit_length()) in coverage
+    # The same input always covers the same things
+    assert fuzzer.run_input(my_chip8, base_state, roms['counter'], (), 300) == (coverage, None)
+
+# A crash is caught and reported rather than stopping the fuzzer, and the
+# machine is clean again for the next run
+def test_run_input_crash():
+    game = bytes([
+        0x22, 0x00, # Call 0x200, forever
+    ])
+    coverage, crash = fuzzer.run_input(my_chip8, base_state, game, (), 10)
+    assert crash == ('IndexError', 'cpu2xxx', 0x200, 0x2200)
+    coverage, crash = fuzzer.run_input(my_chip8, base_state, roms['counter'], (), 10)
+    assert crash is None
+
+# Fuzzing finds new coverage, and adds the inputs that reach it to the corpus
+def test_fuzz():
+    corpus = [(roms['counter'], ())]
+    coverage, crash = fuzzer.run_input(my_chip8, base_state, roms['counter'], (), 20)
+    covered = len(coverage)
+    found, crashes, runs = fuzzer.fuzz(my_chip8, base_state, corpus, coverage, random.Random(1), 200, 20)
+    assert runs == 200
+    assert len(found) > 0
+    assert corpus[1:] == found
+    assert len(coverage) > covered
+    for (game, events) in found:
+        assert 0 < len(game) <= my_chip8.max_game_size
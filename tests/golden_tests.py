@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+import json
+import os
+import sys
+
+from src import chip8
+from tests.roms import roms
+
+# Runs every game in tests/roms.py for fixed numbers of instructions, and
+# checks the digest of the screen at each against the one stored in
+# tests/golden.json. A game is run once for all its checkpoints, and only a
+# 64 bit number is kept and compared at each, so many games with many
+# checkpoints stay cheap to check.
+#
+# After a change that is meant to change what is drawn, or a new game in the
+# catalogue, store the new digests with:
+#
+#   python -m tests.golden_tests --update
+
+golden_path = os.path.join(os.path.dirname(__file__), 'golden.json')
+checkpoints = [250, 2500, 25000]
+
+def setup():
+    global my_chip8
+    my_chip8 = chip8.Chip8(0)
+    my_chip8.initialise()
+
+# The digest at each checkpoint, run a frame of instructions at a time with
+# the timers counted down between frames, as run_frame does. Each digest is
+# also checked against one worked out from the whole screen.
+def digests(my_chip8, game):
+    my_chip8.reset(0)
+    my_chip8.load_game(game)
+    found = {}
+    done = 0
+    for checkpoint in checkpoints:
+        while done < checkpoint:
+            my_chip8.execute_opcode()
+            done += 1
+            if done % my_chip8.cycles_per_frame == 0:
+                my_chip8.count_down_timers()
+        assert my_chip8.screen_digest == my_chip8.compute_screen_digest()
+        found[str(checkpoint)] = '%016x' % my_chip8.screen_digest
+    return found
+
+def load_golden():
+    with open(golden_path) as golden_file:
+        return json.load(golden_file)
+
+def test_golden():
+    golden = load_golden()
+    assert sorted(golden) == sorted(roms)
+    failures = []
+    for (name, game) in sorted(roms.items()):
+        found = digests(my_chip8, game)
+        for checkpoint in sorted(found, key=int):
+            if found[checkpoint] != golden[name].get(checkpoint):
+                failures.append("%s at %s: %s, expected %s" % (
+                    name, checkpoint, found[checkpoint], golden[name].get(checkpoint)))
+    assert not failures, '\n'.join(failures)
+
+# The digest follows the screen through drawing, clearing and loading states
+def test_screen_digest():
+    my_chip8.reset()
+    assert my_chip8.screen_digest == 0
+    # 0x200 draws digit 0 at (60, 30), clipped to 4 by 2, then 0x202 draws it
+    # again to rub it out
+    my_chip8.v[0x1] = 60
+    my_chip8.v[0x2] = 30
+    my_chip8.memory[0x200] = 0xD1
+    my_chip8.memory[0x201] = 0x25
+    my_chip8.memory[0x202] = 0xD1
+    my_chip8.memory[0x203] = 0x25
+    my_chip8.memory[0x204] = 0x00
+    my_chip8.memory[0x205] = 0xE0
+    my_chip8.emulate_cycle()
+    keys = my_chip8.pixel_keys
+    assert my_chip8.screen_digest == int(keys[30, 60] ^ keys[30, 61] ^ keys[30, 62] ^ keys[30, 63] ^ keys[31, 60] ^ keys[31, 63])
+    state = my_chip8.save_state()
+    digest = my_chip8.screen_digest
+    my_chip8.emulate_cycle()
+    assert my_chip8.screen_digest == 0
+    my_chip8.load_state(state)
+    assert my_chip8.screen_digest == digest
+    assert my_chip8.clone().screen_digest == digest
+    my_chip8.program_counter = 0x204
+    my_chip8.emulate_cycle()
+    assert my_chip8.screen_digest == 0
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['--update']:
+        sys.exit("Usage: python -m tests.golden_tests --update")
+    setup()
+    golden = {name: digests(my_chip8, game) for (name, game) in sorted(roms.items())}
+    with open(golden_path, 'w') as golden_file:
+        json.dump(golden, golden_file, indent=4, sort_keys=True)
+        golden_file.write('\n')
+    print("Stored %d digests for %d games in %s" % (len(golden) * len(checkpoints), len(golden), golden_path))
@@ -0,0 +1,61 @@
+from src import chip8
+from src import headless
+from tests.roms import roms
+
+def setup():
+    global my_chip8
+    my_chip8 = chip8.Chip8(0)
+    my_chip8.initialise()
+
+# Waits on the delay timer, then counts the times round in V1
+game = bytes([
+    0x60, 0x20, # 200: V0 = 0x20
+    0xF0, 0x15, # 202: Delay timer = V0
+    0xF2, 0x07, # 204: V2 = delay timer
+    0x32, 0x00, # 206: Skip if V2 == 0
+    0x12, 0x04, # 208: Jump to 0x204
+    0x71, 0x01, # 20A: V1 += 1
+    0x12, 0x00, # 20C: Jump to 0x200
+])
+
+# Frames spent waiting on the timer are skipped, but still counted, and the
+# machine ends up as if every frame had been run
+def test_run():
+    for blocks in (False, True):
+        my_chip8.reset(0)
+        my_chip8.load_game(game)
+        counter = headless.run(my_chip8, 100, blocks)
+        assert my_chip8.frame_count == 100
+        assert counter < 100 * my_chip8.cycles_per_frame
+
+        other = chip8.Chip8(0)
+        other.initialise()
+        other.load_game(game)
+        for frame in range(0, 100):
+            other.run_frame()
+        assert my_chip8.save_state() == other.save_state()
+
+    my_chip8.reset(0)
+    my_chip8.load_game(game)
+    assert headless.run(my_chip8, 0) == 0
+    assert my_chip8.frame_count == 0
+
+# Exactly the number of instructions asked for are run, whether or not that
+# is a whole number of frames, and the same either way
+def test_run_cycles():
+    for cycles in (0, 1, 25, 1003):
+        states = []
+        for blocks in (False, True):
+            my_chip8.reset(0)
+            my_chip8.load_game(roms['timer'])
+            assert headless.run_cycles(my_chip8, cycles, blocks) == cycles
+            assert my_chip8.frame_count == cycles // my_chip8.cycles_per_frame
+            states.append(my_chip8.save_state())
+        assert states[0] == states[1]
+
+    # Waiting on a key still counts each instruction
+    my_chip8.reset(0)
+    my_chip8.load_game(bytes([0xF0, 0x0A]))
+    assert headless.run_cycles(my_chip8, 15) == 15
+    assert my_chip8.frame_count == 1
+    assert my_chip8.program_counter == 0x200
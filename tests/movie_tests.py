@@ -0,0 +1,109 @@
+from src import chip8
+from src import movie
+from src import rewind
+import os
+import tempfile
+
+def setup():
+    global my_chip8
+    my_chip8 = chip8.Chip8()
+    my_chip8.initialise()
+
+# Waits for a key, adds it to V1, and then waits on the delay timer
+game = bytes([
+    0xF0, 0x0A, # V0 = key
+    0x81, 0x04, # V1 += V0
+    0x60, 0x10, # V0 = 0x10
+    0xF0, 0x15, # Delay timer = V0
+    0xF2, 0x07, # V2 = delay timer
+    0x32, 0x00, # Skip if V2 == 0
+    0x12, 0x08, # Jump to 0x208
+    0x12, 0x00, # Jump to 0x200
+])
+
+# Key presses recorded live play back to the same place
+def test_record_and_replay():
+    with tempfile.TemporaryDirectory() as directory:
+        game_path = os.path.join(directory, 'game.ch8')
+        movie_path = os.path.join(directory, 'game.c8m')
+        with open(game_path, 'wb') as game_file:
+            game_file.write(game)
+
+        # Re-initialise the system
+        my_chip8.reset(seed=7)
+        my_chip8.load_game(game_path)
+        recorder = movie.Recorder(my_chip8, game_path)
+        presses = {3: (0x5, 1), 4: (0x5, 0), 30: (0xA, 1), 40: (0xA, 0)}
+        for frame in range(0, 60):
+            if frame in presses:
+                recorder.set_key(*presses[frame])
+            my_chip8.run_frame()
+        recorder.save(movie_path)
+        expected = my_chip8.save_state()
+
+        recorded = movie.Movie.load(movie_path)
+        assert recorded.seed == 7
+        assert recorded.game_hash == movie.hash_game(game_path)
+        assert recorded.events == [(3, 0x5, 1), (4, 0x5, 0), (30, 0xA, 1), (40, 0xA, 0)]
+        assert recorded.frames == 60
+
+        # Play back, skipping the frames spent waiting on the timer, for as
+        # long as was recorded
+        my_chip8.reset(seed=1)
+        my_chip8.load_game(game_path)
+        movie.replay(my_chip8, recorded)
+        assert my_chip8.frame_count == 60
+        assert my_chip8.v[0x1] == 0x5 + 0xA
+        assert my_chip8.save_state() == expected
+
+# A movie with no key presses still plays back for as long as it was recorded
+def test_replay_without_presses():
+    with tempfile.TemporaryDirectory() as directory:
+        movie_path = os.path.join(directory, 'game.c8m')
+        # Re-initialise the system
+        my_chip8.reset(seed=7)
+        my_chip8.load_game(game)
+        recorder = movie.Recorder(my_chip8, __file__)
+        for frame in range(0, 25):
+            my_chip8.run_frame()
+        recorder.save(movie_path)
+
+        my_chip8.reset(seed=7)
+        my_chip8.load_game(game)
+        movie.replay(my_chip8, movie.Movie.load(movie_path))
+        assert my_chip8.frame_count == 25
+
+# Stepping back while recording leaves a movie of what was actually played,
+# without the frames that were stepped back over
+def test_record_with_rewind():
+    with tempfile.TemporaryDirectory() as directory:
+        movie_path = os.path.join(directory, 'game.c8m')
+        # Re-initialise the system
+        my_chip8.reset(seed=7)
+        my_chip8.load_game(game)
+        recorder = movie.Recorder(my_chip8, __file__)
+        rewinder = rewind.Rewind(my_chip8)
+        presses = {3: (0x5, 1), 4: (0x5, 0), 30: (0xA, 1)}
+        for frame in range(0, 40):
+            if frame in presses:
+                recorder.set_key(*presses[frame])
+            my_chip8.run_frame()
+            rewinder.record()
+        # Back to before 0xA was pressed, still holding it, then on again
+        for frame in range(0, 15):
+            rewinder.step_back()
+            recorder.rewind()
+        assert my_chip8.frame_count == 25
+        for frame in range(0, 20):
+            my_chip8.run_frame()
+            rewinder.record()
+        recorder.save(movie_path)
+        expected = my_chip8.save_state()
+
+        recorded = movie.Movie.load(movie_path)
+        assert recorded.events == [(3, 0x5, 1), (4, 0x5, 0), (25, 0xA, 1)]
+        my_chip8.reset(seed=7)
+        my_chip8.load_game(game)
+        movie.replay(my_chip8, recorded)
+        assert my_chip8.frame_count == 45
+        assert my_chip8.save_state() == expected
@@ -0,0 +1,73 @@
+from src import chip8
+from src import profiler
+import os
+import tempfile
+
+def setup():
+    global my_chip8
+    my_chip8 = chip8.Chip8()
+    my_chip8.initialise()
+
+# Adds to V0 in a loop
+game = bytes([
+    0x60, 0x00, # V0 = 0
+    0x70, 0x01, # V0 += 1
+    0x12, 0x02, # Jump to 0x202
+])
+
+# Every instruction is counted by family, handler and address
+def test_profile():
+    my_chip8.reset()
+    my_chip8.load_game(game)
+    my_profiler = profiler.Profiler()
+    my_chip8.attach(my_profiler)
+    for loop in range(0, 9):
+        my_chip8.emulate_cycle()
+    my_chip8.detach(my_profiler)
+    my_chip8.emulate_cycle()
+
+    assert my_profiler.total() == 9
+    assert my_profiler.family_counts[0x6] == 1
+    assert my_profiler.family_counts[0x7] == 4
+    assert my_profiler.family_counts[0x1] == 4
+    assert my_profiler.address_counts[0x200] == 1
+    assert my_profiler.address_counts[0x202] == 4
+    assert my_profiler.address_counts[0x204] == 4
+    report = my_profiler.report()
+    assert report['instructions'] == 9
+    assert report['families'] == {'1': 4, '6': 1, '7': 4}
+    assert sum(handler['count'] for handler in report['handlers'].values()) == 9
+    assert my_chip8.v[0] == 5
+    assert 'execute_opcode' not in vars(my_chip8)
+
+# Frames fall back to the interpreter while being profiled
+def test_profile_blocks():
+    my_chip8.reset()
+    my_chip8.load_game(game)
+    my_profiler = profiler.Profiler()
+    my_chip8.attach(my_profiler)
+    my_chip8.run_frame(blocks=True)
+    my_chip8.detach(my_profiler)
+    assert my_profiler.total() == my_chip8.cycles_per_frame
+
+# The heatmap has one pixel per byte of memory, brightest where it was busiest
+def test_heatmap():
+    my_chip8.reset()
+    my_chip8.load_game(game)
+    my_profiler = profiler.Profiler()
+    my_chip8.attach(my_profiler)
+    for loop in range(0, 9):
+        my_chip8.emulate_cycle()
+    my_chip8.detach(my_profiler)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'heatmap.pgm')
+        my_profiler.write_heatmap(path)
+        with open(path, 'rb') as image_file:
+            image = image_file.read()
+    header = b'P5\n64 64\n255\n'
+    assert image.startswith(header)
+    pixels = image[len(header):]
+    assert len(pixels) == 4096
+    assert pixels[0x202] == 255
+    assert 0 < pixels[0x200] < 255
+    assert pixels[0x206] == 0
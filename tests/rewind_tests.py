@@ -0,0 +1,78 @@
+from src import chip8
+from src import rewind
+
+def setup():
+    global my_chip8
+    my_chip8 = chip8.Chip8()
+    my_chip8.initialise()
+
+# A small program that draws a moving sprite every frame
+game = bytes([
+    0xA0, 0x00, # I = font for 0
+    0xD0, 0x15, # Draw at V0, V1
+    0x70, 0x01, # V0 += 1
+    0xD0, 0x15, # Draw at V0, V1
+    0x12, 0x04, # Jump to 0x204
+])
+
+# Stepping back goes through every recorded frame in reverse, across
+# keyframes, until only the oldest is left
+def test_step_back():
+    # Re-initialise the system
+    my_chip8.reset()
+    my_chip8.load_game(game)
+    recorder = rewind.Rewind(my_chip8, keyframe_interval=8)
+    states = []
+    for frame in range(0, 20):
+        my_chip8.run_frame()
+        recorder.record()
+        states.append(my_chip8.save_state())
+    assert len(recorder) == 20
+    for frame in range(18, -1, -1):
+        assert recorder.step_back()
+        assert my_chip8.save_state() == states[frame]
+    assert not recorder.step_back()
+    assert my_chip8.save_state() == states[0]
+
+# Frames in between keyframes only keep what changed
+def test_deltas_are_small():
+    # Re-initialise the system
+    my_chip8.reset()
+    my_chip8.load_game(game)
+    recorder = rewind.Rewind(my_chip8, keyframe_interval=100)
+    my_chip8.run_frame()
+    recorder.record()
+    keyframe_size = recorder.size
+    for frame in range(0, 10):
+        my_chip8.run_frame()
+        recorder.record()
+    # The registers, and the five rows the sprite is drawn on
+    assert recorder.size - keyframe_size <= 10 * 6 * (64 + 2)
+
+# The oldest frames are thrown away to stay under the size limit
+def test_size_limit():
+    # Re-initialise the system
+    my_chip8.reset()
+    my_chip8.load_game(game)
+    recorder = rewind.Rewind(my_chip8, keyframe_interval=4, max_megabytes=0.1)
+    for frame in range(0, 200):
+        my_chip8.run_frame()
+        recorder.record()
+    assert recorder.size <= 0.1 * 1024 * 1024
+    assert 4 < len(recorder) < 200
+
+# Stepping back leaves the keys as they are now, rather than as they were
+def test_step_back_keeps_keys():
+    # Re-initialise the system
+    my_chip8.reset()
+    my_chip8.load_game(game)
+    recorder = rewind.Rewind(my_chip8)
+    my_chip8.key[0x5] = 1
+    for frame in range(0, 3):
+        my_chip8.run_frame()
+        recorder.record()
+    my_chip8.key[0x5] = 0
+    my_chip8.key[0xA] = 1
+    assert recorder.step_back()
+    assert my_chip8.key[0x5] == 0
+    assert my_chip8.key[0xA] == 1
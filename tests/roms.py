@@ -0,0 +1,98 @@
+# A small catalogue of test programs, written for these tests and free to use
+# for anything. Each one loops forever, so they can be run for any length of
+# time, and between them they use most of the instruction set.
+roms = {}
+
+# Arithmetic in a tight loop, with no drawing at all
+roms['counter'] = bytes([
+    0x60, 0x00, # 200: V0 = 0
+    0x61, 0x00, # 202: V1 = 0
+    0x70, 0x01, # 204: V0 += 1
+    0x81, 0x04, # 206: V1 += V0
+    0x82, 0x16, # 208: V2 = V1 >> 1
+    0x30, 0x00, # 20A: Skip if V0 == 0
+    0x12, 0x04, # 20C: Jump to 0x204
+    0x73, 0x01, # 20E: V3 += 1
+    0x12, 0x04, # 210: Jump to 0x204
+])
+
+# Draws the font's digits across the screen a row at a time, clearing it
+# after each row
+roms['digits'] = bytes([
+    0x60, 0x00, # 200: V0 = 0
+    0x61, 0x00, # 202: V1 = 0
+    0x62, 0x00, # 204: V2 = 0
+    0xF0, 0x29, # 206: I = digit V0
+    0xD1, 0x25, # 208: Draw 5 rows at V1, V2
+    0x71, 0x05, # 20A: V1 += 5
+    0x70, 0x01, # 20C: V0 += 1
+    0x40, 0x10, # 20E: Skip if V0 != 0x10
+    0x12, 0x14, # 210: Jump to 0x214
+    0x12, 0x06, # 212: Jump to 0x206
+    0x00, 0xE0, # 214: Clear the screen
+    0x60, 0x00, # 216: V0 = 0
+    0x72, 0x06, # 218: V2 += 6
+    0x61, 0x00, # 21A: V1 = 0
+    0x12, 0x06, # 21C: Jump to 0x206
+])
+
+# Counts in VA, drawing its decimal digits from a subroutine
+roms['subroutines'] = bytes([
+    0x6A, 0x00, # 200: VA = 0
+    0xA3, 0x00, # 202: I = 0x300
+    0x22, 0x0A, # 204: Call 0x20A
+    0x7A, 0x01, # 206: VA += 1
+    0x12, 0x02, # 208: Jump to 0x202
+    0xFA, 0x33, # 20A: Store the digits of VA at I
+    0xF2, 0x65, # 20C: Load V0 to V2 from I
+    0x6B, 0x00, # 20E: VB = 0
+    0xF0, 0x29, # 210: I = digit V0
+    0xDB, 0x65, # 212: Draw 5 rows at VB, V6
+    0x7B, 0x05, # 214: VB += 5
+    0xF1, 0x29, # 216: I = digit V1
+    0xDB, 0x65, # 218: Draw 5 rows at VB, V6
+    0x7B, 0x05, # 21A: VB += 5
+    0xF2, 0x29, # 21C: I = digit V2
+    0xDB, 0x65, # 21E: Draw 5 rows at VB, V6
+    0x00, 0xEE, # 220: Return
+])
+
+# Fills the screen with randomly chosen diagonal lines, in the style of the
+# classic maze program
+roms['maze'] = bytes([
+    0x60, 0x00, # 200: V0 = 0
+    0x61, 0x00, # 202: V1 = 0
+    0xA2, 0x1E, # 204: I = 0x21E
+    0xC2, 0x01, # 206: V2 = random & 1
+    0x32, 0x00, # 208: Skip if V2 == 0
+    0xA2, 0x22, # 20A: I = 0x222
+    0xD0, 0x14, # 20C: Draw 4 rows at V0, V1
+    0x70, 0x04, # 20E: V0 += 4
+    0x30, 0x40, # 210: Skip if V0 == 64
+    0x12, 0x04, # 212: Jump to 0x204
+    0x60, 0x00, # 214: V0 = 0
+    0x71, 0x04, # 216: V1 += 4
+    0x31, 0x20, # 218: Skip if V1 == 32
+    0x12, 0x04, # 21A: Jump to 0x204
+    0x12, 0x00, # 21C: Jump to 0x200
+    0x80, 0x40, 0x20, 0x10, # 21E: Sprite \
+    0x10, 0x20, 0x40, 0x80, # 222: Sprite /
+])
+
+# Shows a count of timer waits, spinning on the delay timer in between
+roms['timer'] = bytes([
+    0x60, 0x05, # 200: V0 = 5
+    0xF0, 0x15, # 202: Delay timer = V0
+    0xF1, 0x07, # 204: V1 = delay timer
+    0x31, 0x00, # 206: Skip if V1 == 0
+    0x12, 0x04, # 208: Jump to 0x204
+    0xE1, 0x9E, # 20A: Skip if key V1 is pressed
+    0x72, 0x01, # 20C: V2 += 1
+    0x83, 0x20, # 20E: V3 = V2
+    0x64, 0x0F, # 210: V4 = 0x0F
+    0x83, 0x42, # 212: V3 &= V4
+    0x00, 0xE0, # 214: Clear the screen
+    0xF3, 0x29, # 216: I = digit V3
+    0xD5, 0x55, # 218: Draw 5 rows at V5, V5
+    0x12, 0x00, # 21A: Jump to 0x200
+])
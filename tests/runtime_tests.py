@@ -0,0 +1,68 @@
+from src import chip8
+from src import runtime
+import asyncio
+import os
+import tempfile
+import time
+
+def setup():
+    global my_chip8
+    my_chip8 = chip8.Chip8()
+    my_chip8.initialise()
+
+# Draws digit 0 over and over, so the screen changes every frame
+game = bytes([
+    0xD0, 0x05, # Draw 5 rows at V0, V0
+    0x12, 0x00, # Jump to 0x200
+])
+
+# Takes a tenth of a second to present, without blocking the event loop
+class SlowFrontend(runtime.Frontend):
+    presents = 0
+
+    async def present(self, my_chip8):
+        await asyncio.to_thread(time.sleep, 0.1)
+        self.presents += 1
+
+# A slow present doesn't hold up emulation
+def test_slow_present():
+    my_chip8.reset()
+    my_chip8.load_game(game)
+    frontend = SlowFrontend()
+    my_runtime = runtime.Runtime(my_chip8, [frontend])
+    asyncio.run(my_runtime.run(0.5))
+    assert my_runtime.frames >= 20
+    assert my_runtime.instructions == my_runtime.frames * my_chip8.cycles_per_frame
+    assert 2 <= frontend.presents <= 6
+
+# An error in the step ends the run and is raised from it, rather than the
+# run carrying on with nothing being emulated
+def test_step_error():
+    def step():
+        raise ZeroDivisionError()
+
+    my_chip8.reset()
+    recorder = runtime.ScreenRecorder(os.devnull)
+    my_runtime = runtime.Runtime(my_chip8, [recorder], step)
+    try:
+        asyncio.run(my_runtime.run(5))
+    except ZeroDivisionError:
+        pass
+    else:
+        assert False, 'the error was not raised'
+    assert recorder.file.closed
+
+# Each change to the screen is written out as a PBM image
+def test_screen_recorder():
+    my_chip8.reset()
+    my_chip8.load_game(game)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'video.pbm')
+        recorder = runtime.ScreenRecorder(path)
+        asyncio.run(runtime.Runtime(my_chip8, [recorder]).run(0.2))
+        with open(path, 'rb') as video_file:
+            video = video_file.read()
+    header = b'P4\n64 32\n'
+    assert recorder.frames_written >= 2
+    assert len(video) == recorder.frames_written * (len(header) + 8 * 32)
+    assert video.startswith(header)
@@ -0,0 +1,59 @@
+from src import chip8
+from src import tracer
+import os
+import tempfile
+
+def setup():
+    global my_chip8
+    my_chip8 = chip8.Chip8()
+    my_chip8.initialise()
+
+# Adds V0 to V1 in a loop
+game = bytes([
+    0x60, 0x80, # V0 = 0x80
+    0x81, 0x04, # V1 += V0
+    0xA3, 0x00, # I = 0x300
+    0x12, 0x02, # Jump to 0x202
+])
+
+# Each instruction is one record, with the register it changed
+def test_trace():
+    my_chip8.reset()
+    my_chip8.load_game(game)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'trace.c8t')
+        with open(path, 'wb') as trace_file:
+            my_tracer = tracer.Tracer(trace_file, buffer_records=2)
+            my_chip8.attach(my_tracer)
+            for counter in range(0, 7):
+                my_chip8.emulate_cycle()
+            my_chip8.detach(my_tracer)
+            my_tracer.flush()
+        assert os.path.getsize(path) == tracer.trace_header.size + 7 * tracer.trace_record.size
+        records = tracer.load(path)
+        assert list(records['pc']) == [0x200, 0x202, 0x204, 0x206, 0x202, 0x204, 0x206]
+        assert list(records['cycle']) == list(range(0, 7))
+        assert records[2]['i'] == 0x300
+        # The second 8XY4 carries, changing V1 and VF
+        adds = tracer.select(records, opcode='8XY4')
+        assert list(adds['register']) == [1, 1]
+        assert list(adds['old']) == [0x00, 0x80]
+        assert list(adds['new']) == [0x80, 0x00]
+        assert list(adds['vf']) == [0, 1]
+        assert list(tracer.select(records, address=(0x204, 0x206))['opcode']) == [0xA300, 0xA300]
+        assert records[3]['register'] == tracer.no_register
+        del records
+
+# A ring keeps only the last few records
+def test_trace_ring():
+    my_chip8.reset()
+    my_chip8.load_game(game)
+    my_tracer = tracer.Tracer(ring=4)
+    my_chip8.attach(my_tracer)
+    for counter in range(0, 10):
+        my_chip8.emulate_cycle()
+    my_chip8.detach(my_tracer)
+    records = my_tracer.records()
+    assert len(records) == 4 * tracer.trace_record.size
+    cycles = [record[0] for record in tracer.trace_record.iter_unpack(records)]
+    assert cycles == [6, 7, 8, 9]